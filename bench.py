@@ -0,0 +1,343 @@
+"""Offline benchmarks for the game engine hot paths.
+
+Drives the handlers in main.py with fake contexts and real Update objects
+bound to a stub bot, so no request ever leaves the process. Results can be
+saved as JSON and compared against a run from another commit:
+
+    python bench.py --json before.json
+    python bench.py --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+import main
+from board import generate_dynamic_items
+from board_pool import BoardPool
+
+Config = Tuple[int, int, int]
+
+DEFAULT_CONFIGS: List[Config] = [
+    (2, 2, 2),
+    (3, 4, 2),
+    (4, 4, 2),
+    (6, 6, 2),
+    (8, 9, 2),
+    (8, 9, 3),
+    (8, 9, 4),
+]
+
+
+class StubBot:
+    """Answers every Bot API call used by the handlers without any I/O."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def _call(self, *args: Any, **kwargs: Any) -> bool:
+        self.calls += 1
+        return True
+
+    answer_callback_query = _call
+    edit_message_text = _call
+    send_message = _call
+
+
+class FakeContext:
+    """The parts of CallbackContext the handlers use."""
+
+    def __init__(self, bot: StubBot) -> None:
+        self.bot = bot
+        self.user_data: Dict[Any, Any] = {}
+        self.bot_data: Dict[Any, Any] = {}
+        self.args: List[str] = []
+
+
+USER = User(id=1, first_name="Bench", is_bot=False)
+CHAT = Chat(id=1, type=Chat.PRIVATE)
+
+
+def text_update(bot: StubBot, text: str) -> Update:
+    chat = Chat(id=CHAT.id, type=CHAT.type)
+    chat.set_bot(bot)  # type: ignore[arg-type]
+    message = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=chat,
+        from_user=USER,
+        text=text,
+    )
+    message.set_bot(bot)  # type: ignore[arg-type]
+    update = Update(update_id=1, message=message)
+    update.set_bot(bot)  # type: ignore[arg-type]
+    return update
+
+
+def tap_update(bot: StubBot, board_message: Message, cell_id: str) -> Update:
+    query = CallbackQuery(
+        id="1", from_user=USER, chat_instance="1", message=board_message, data=cell_id
+    )
+    query.set_bot(bot)  # type: ignore[arg-type]
+    return Update(update_id=1, callback_query=query)
+
+
+def valid_configs() -> List[Config]:
+    """Every board size from 2x1 to 8x9 with its smallest playable match count."""
+    configs = []
+    for x in range(1, 9):
+        for y in range(1, 10):
+            total = x * y
+            for match_count in range(2, total + 1):
+                sets = total // match_count
+                if total % match_count == 0 and 2 <= sets <= len(main.EMOJI_POOL):
+                    configs.append((x, y, match_count))
+                    break
+    return configs
+
+
+async def new_game(bot: StubBot, config: Config) -> FakeContext:
+    x, y, match_count = config
+    context = FakeContext(bot)
+    await main.choose_dimensions(text_update(bot, f"{x}x{y}"), context)  # type: ignore[arg-type]
+    await main.choose_match_count(text_update(bot, str(match_count)), context)  # type: ignore[arg-type]
+    return context
+
+
+def solving_taps(context: FakeContext) -> List[str]:
+    """Returns the callback ids of a game played with a mismatch before every match."""
+    board = context.user_data["board"]
+    positions: Dict[int, List[int]] = {}
+    for index in range(board.cell_count):
+        positions.setdefault(board.items[index], []).append(index)
+    groups = list(positions.values())
+    taps = []
+    for i, group in enumerate(groups):
+        if i + 1 < len(groups):
+            # One mismatch: the first cells of this group and of the next one
+            mismatch = group[: board.match_count - 1] + groups[i + 1][:1]
+            taps.extend(board.cell_id(index) for index in mismatch)
+        taps.extend(board.cell_id(index) for index in group)
+    return taps
+
+
+async def measure(
+    func: Callable[[], Awaitable[Any]],
+    iterations: int,
+    trace_allocations: bool,
+    setup: Callable[[], Awaitable[Any]] | None = None,
+) -> Dict[str, float]:
+    """Times func(), calling setup() untimed before every call if given."""
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            await setup()
+        started = time.perf_counter_ns()
+        await func()
+        samples.append(time.perf_counter_ns() - started)
+
+    result = summarize(samples)
+    if trace_allocations:
+        allocations = []
+        tracemalloc.start()
+        for _ in range(min(iterations, 200)):
+            if setup is not None:
+                await setup()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await func()
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        result["alloc_bytes"] = statistics.fmean(allocations)
+    return result
+
+
+def summarize(samples_ns: List[int]) -> Dict[str, float]:
+    samples_us = sorted(sample / 1000 for sample in samples_ns)
+    percentiles = statistics.quantiles(samples_us, n=100, method="inclusive")
+    return {
+        "calls": len(samples_us),
+        "mean_us": statistics.fmean(samples_us),
+        "p50_us": percentiles[49],
+        "p90_us": percentiles[89],
+        "p99_us": percentiles[98],
+    }
+
+
+async def bench_config(
+    config: Config, iterations: int, trace_allocations: bool
+) -> Dict[str, Dict[str, float]]:
+    bot = StubBot()
+    x, y, match_count = config
+    results = {}
+
+    async def generate_items() -> None:
+        generate_dynamic_items(x, y, match_count)
+
+    results["generate_dynamic_items"] = await measure(
+        generate_items, iterations, trace_allocations
+    )
+
+    context = await new_game(bot, config)
+
+    async def initial_board() -> None:
+        main.get_initial_board_state(context)  # type: ignore[arg-type]
+
+    # Miss: nothing pooled, the board is shuffled on the spot
+    pool = main.board_pool
+    main.board_pool = BoardPool(size=0)
+    results["get_initial_board_state_miss"] = await measure(
+        initial_board, iterations, trace_allocations
+    )
+    # Hit: a board is pooled before every call, the call pops it and
+    # schedules the refill task. The first call makes the config popular.
+    main.board_pool = BoardPool(size=1)
+    await initial_board()
+    results["get_initial_board_state_hit"] = await measure(
+        initial_board, iterations, trace_allocations, setup=main.board_pool.refill
+    )
+    main.board_pool = pool
+
+    async def keyboard_cold() -> None:
+        context.user_data["board"].render_cache = None
+        main.generate_keyboard(context)  # type: ignore[arg-type]
+
+    results["generate_keyboard"] = await measure(
+        keyboard_cold, iterations, trace_allocations
+    )
+
+    # button_tap: replay whole games until enough taps were measured
+    board_message = Message(
+        message_id=2, date=datetime.now(timezone.utc), chat=CHAT, text=""
+    )
+    board_message.set_bot(bot)  # type: ignore[arg-type]
+
+    async def replayed_taps(count: int) -> AsyncIterator[Tuple[Update, FakeContext]]:
+        taps = 0
+        while taps < count:
+            context = await new_game(bot, config)
+            for cell_id in solving_taps(context):
+                yield tap_update(bot, board_message, cell_id), context
+                taps += 1
+
+    tap_samples: List[int] = []
+    async for update, context in replayed_taps(iterations):
+        started = time.perf_counter_ns()
+        await main.button_tap(update, context)  # type: ignore[arg-type]
+        tap_samples.append(time.perf_counter_ns() - started)
+    results["button_tap"] = summarize(tap_samples)
+    if trace_allocations:
+        allocations = []
+        tracemalloc.start()
+        async for update, context in replayed_taps(min(iterations, 200)):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await main.button_tap(update, context)  # type: ignore[arg-type]
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        results["button_tap"]["alloc_bytes"] = statistics.fmean(allocations)
+
+    return results
+
+
+async def bench_show_scores(
+    iterations: int, trace_allocations: bool
+) -> Dict[str, float]:
+    bot = StubBot()
+    context = FakeContext(bot)
+    for x, y, match_count in valid_configs():
+        for i in range(main.MAX_HIGH_SCORES_PER_CONFIG):
+            main.leaderboard.add(f"{x}x{y}_match{match_count}", f"p{i}", 10.0 + i)
+    update = text_update(bot, "/scores")
+
+    async def show_scores() -> None:
+        await main.show_scores(update, context)  # type: ignore[arg-type]
+
+    return await measure(show_scores, iterations, trace_allocations)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    configs = valid_configs() if args.all else DEFAULT_CONFIGS
+    results: Dict[str, Dict[str, float]] = {}
+    for config in configs:
+        label = "{}x{}_match{}".format(*config)
+        for name, stats in (
+            await bench_config(config, args.iterations, args.allocations)
+        ).items():
+            results[f"{name}[{label}]"] = stats
+    results["show_scores"] = await bench_show_scores(args.iterations, args.allocations)
+    return results
+
+
+def print_results(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]] | None
+) -> None:
+    header = f"{'benchmark':<44} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10}"
+    if any("alloc_bytes" in stats for stats in results.values()):
+        header += f" {'alloc B':>10}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for name, stats in results.items():
+        line = f"{name:<44} {stats['p50_us']:>10.2f} {stats['p90_us']:>10.2f} {stats['p99_us']:>10.2f}"
+        if "alloc_bytes" in stats:
+            line += f" {stats['alloc_bytes']:>10.0f}"
+        if baseline:
+            base = baseline.get(name)
+            line += (
+                f" {stats['p50_us'] / base['p50_us']:>11.2f}x"
+                if base
+                else f" {'-':>12}"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game engine offline.")
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1000,
+        help="Measured calls per benchmark. Default is 1000.",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Benchmark every board size from 2x1 to 8x9 instead of a representative set.",
+    )
+    parser.add_argument(
+        "--allocations",
+        action="store_true",
+        help="Also measure bytes allocated per call with tracemalloc.",
+    )
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare", type=str, help="JSON results of an earlier run to compare against."
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"python": sys.version, "created": time.time(), "results": results},
+                f,
+                indent=2,
+            )
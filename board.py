@@ -0,0 +1,406 @@
+import logging
+import random
+import secrets
+import time
+import zlib
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Emoji pools for dynamic item generation, by version. Boards store indices
+# into the pool they were created with, so a released pool must never be
+# edited: add a new version and point EMOJI_POOL_VERSION at it instead.
+EMOJI_POOLS: Dict[int, List[str]] = {}
+EMOJI_POOLS[1] = [
+    "🍓",
+    "🍌",
+    "🍉",
+    "🍇",
+    "🥝",
+    "🍍",
+    "🍑",
+    "🍒",
+    "🥭",
+    "🥥",
+    "🥑",
+    "🍆",
+    "🍅",
+    "🌶️",
+    "🥕",
+    "🌽",
+    "🥦",
+    "🍄",
+    "🥜",
+    "🌰",
+    "🍞",
+    "🥐",
+    "🥨",
+    "🥯",
+    "🥞",
+    "🧇",
+    "🧀",
+    "🍖",
+    "🍗",
+    "🥩",
+    "🍔",
+    "🍟",
+    "🍕",
+    "🌭",
+    "🥪",
+    "🌮",
+]
+EMOJI_POOL_VERSION = 1
+EMOJI_POOL = EMOJI_POOLS[EMOJI_POOL_VERSION]
+
+HIDDEN_CELL_TEXT = "❓"
+
+# Outcomes of Board.tap
+TAP_IGNORED, TAP_SELECTED, TAP_MATCH, TAP_MISMATCH, TAP_WON = range(5)
+
+# Bumped whenever the pickled layout of Board changes
+BOARD_STATE_VERSION = 5
+
+
+def score_key(size_x: int, size_y: int, match_count: int) -> str:
+    """Returns the leaderboard key of a configuration, e.g. "4x4_match2"."""
+    return f"{size_x}x{size_y}_match{match_count}"
+
+
+def generate_item_indices(
+    board_size_x: int,
+    board_size_y: int,
+    match_count: int,
+    rng: random.Random | None = None,
+) -> List[int] | None:
+    """Generates the shuffled list of EMOJI_POOL indices for a board.
+
+    The layout is shuffled with rng, or the random module's shared generator
+    if None. The same seeded rng always yields the same layout.
+    """
+    num_unique_item_sets = unique_item_set_count(
+        board_size_x, board_size_y, match_count
+    )
+    if num_unique_item_sets is None:
+        return None
+
+    items = []
+    for i in range(num_unique_item_sets):
+        items.extend([i] * match_count)
+
+    (rng or random).shuffle(items)
+    return items
+
+
+def unique_item_set_count(
+    board_size_x: int, board_size_y: int, match_count: int
+) -> int | None:
+    """Returns the number of item types of a board, or None if it cannot be built."""
+    total_cells = board_size_x * board_size_y
+    if total_cells % match_count != 0:
+        logging.error("Total cells not divisible by match count.")
+        return None  # Should be caught by earlier validation
+
+    num_unique_item_sets = total_cells // match_count
+    if (
+        num_unique_item_sets <= 1 and total_cells > 0
+    ):  # Need at least 2 unique sets for a game
+        logging.warning(
+            "Not enough unique item sets possible: %s for %s cells and %s match_count.",
+            num_unique_item_sets,
+            total_cells,
+            match_count,
+        )
+        return None
+
+    if num_unique_item_sets > len(EMOJI_POOL):
+        logging.warning(
+            "Not enough emojis in EMOJI_POOL for the required number of unique items."
+        )
+        return None  # Not enough unique emojis
+
+    return num_unique_item_sets
+
+
+def generate_dynamic_items(
+    board_size_x: int,
+    board_size_y: int,
+    match_count: int,
+    rng: random.Random | None = None,
+) -> List[str] | None:
+    """Generates the list of items based on board size and match count."""
+    indices = generate_item_indices(board_size_x, board_size_y, match_count, rng)
+    if indices is None:
+        return None
+    return [EMOJI_POOL[i] for i in indices]
+
+
+def generate_item_indices_batch(
+    board_count: int,
+    board_size_x: int,
+    board_size_y: int,
+    match_count: int,
+    seed: int | None = None,
+) -> "np.ndarray | None":
+    """Generates board_count shuffled layouts at once with NumPy.
+
+    Returns a uint8 array of EMOJI_POOL indices with shape (board_count,
+    board_size_y, board_size_x), or None if the config is invalid. All rows
+    are shuffled in one vectorized call, so thousands of boards take about
+    as long as a handful of generate_item_indices() calls. The same seed
+    always yields the same batch. A row becomes a playable (seedless) Board
+    with Board(x, y, match_count, bytearray(row.tobytes()), time.time()).
+    NumPy is only needed by this function and imported on first use.
+    """
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError(
+            "generate_item_indices_batch requires NumPy, install it with "
+            "pip install numpy"
+        ) from e
+
+    num_unique_item_sets = unique_item_set_count(
+        board_size_x, board_size_y, match_count
+    )
+    if num_unique_item_sets is None:
+        return None
+
+    items = np.repeat(np.arange(num_unique_item_sets, dtype=np.uint8), match_count)
+    layouts = np.random.default_rng(seed).permuted(
+        np.tile(items, (board_count, 1)), axis=1
+    )
+    return layouts.reshape(board_count, board_size_y, board_size_x)
+
+
+class Board:
+    """Compact state and rules of a single game.
+
+    Cells are numbered row by row starting at 0. Item values are stored as
+    indices into the emoji pool of pool_version in a bytearray, and resolved
+    to emoji only when rendered. The revealed / permanently revealed flags
+    are integer bitsets, so a live game costs a few hundred bytes instead of
+    a dict per cell. Boards created from a seed pickle the seed and a CRC32
+    of the layout instead of the layout, and shuffle it again when loaded. If
+    the shuffle no longer gives the same layout, e.g. after a Python upgrade,
+    the game starts over on the new layout instead of keeping progress that
+    refers to other cells.
+    """
+
+    __slots__ = (
+        "size_x",
+        "size_y",
+        "match_count",
+        "pool_version",
+        "pool",
+        "seed",
+        "items",
+        "revealed",
+        "permanent",
+        "selection",
+        "selected",
+        "selection_mismatch",
+        "matched_groups",
+        "last_matched",
+        "start_time",
+        "last_active",
+        "render_cache",
+        "rendered_fingerprint",
+    )
+
+    def __init__(
+        self,
+        size_x: int,
+        size_y: int,
+        match_count: int,
+        items: bytearray,
+        start_time: float,
+        pool_version: int = EMOJI_POOL_VERSION,
+        seed: int | None = None,
+    ) -> None:
+        self.size_x = size_x
+        self.size_y = size_y
+        self.match_count = match_count
+        self.pool_version = pool_version
+        self.pool = EMOJI_POOLS[pool_version]
+        # The seed items were shuffled with, if they can be generated again
+        self.seed = seed
+        self.items = items
+        self.revealed = 0
+        self.permanent = 0
+        self.selection: List[int] = []
+        # Bitset of the selection and whether its items already differ, kept
+        # up to date on every tap so no tap has to scan the selection
+        self.selected = 0
+        self.selection_mismatch = False
+        self.matched_groups = 0
+        self.last_matched = -1
+        self.start_time = start_time
+        self.last_active = start_time
+        # Opaque per-process cache owned by the front-end, never pickled
+        self.render_cache: object = None
+        # Fingerprint of the state last shown to the player, never pickled
+        self.rendered_fingerprint: Tuple[int, int] | None = None
+
+    @classmethod
+    def new(
+        cls, size_x: int, size_y: int, match_count: int, seed: int | None = None
+    ) -> "Board | None":
+        """Creates a board shuffled with seed, or None if the config is invalid.
+
+        A random seed is drawn if none is given.
+        """
+        if seed is None:
+            seed = secrets.randbits(64)
+        indices = generate_item_indices(
+            size_x, size_y, match_count, random.Random(seed)
+        )
+        if indices is None:
+            return None
+        return cls(
+            size_x, size_y, match_count, bytearray(indices), time.time(), seed=seed
+        )
+
+    def __getstate__(self) -> Tuple:
+        return (
+            BOARD_STATE_VERSION,
+            self.size_x,
+            self.size_y,
+            self.match_count,
+            self.seed,
+            bytes(self.items) if self.seed is None else None,
+            self.revealed,
+            self.permanent,
+            tuple(self.selection),
+            self.matched_groups,
+            self.last_matched,
+            self.start_time,
+            self.last_active,
+            self.pool_version,
+            zlib.crc32(self.items) if self.seed is not None else None,
+        )
+
+    def __setstate__(self, state: Tuple) -> None:
+        if state[0] == 1:  # version 1 did not track activity
+            state = state + (state[-1],)
+        if state[0] < 3:  # versions 1 and 2 always used the first pool
+            state = state + (1,)
+        if state[0] < 4:  # versions 1 to 3 stored the layout without a seed
+            state = state[:4] + (None,) + state[4:]
+        if state[0] < 5:  # versions 1 to 4 had no layout checksum
+            state = state + (None,)
+        (
+            _version,
+            self.size_x,
+            self.size_y,
+            self.match_count,
+            self.seed,
+            items,
+            self.revealed,
+            self.permanent,
+            selection,
+            self.matched_groups,
+            self.last_matched,
+            self.start_time,
+            self.last_active,
+            self.pool_version,
+            layout_checksum,
+        ) = state
+        self.pool = EMOJI_POOLS[self.pool_version]
+        if items is None:
+            items = generate_item_indices(
+                self.size_x, self.size_y, self.match_count, random.Random(self.seed)
+            )
+        self.items = bytearray(items)
+        if layout_checksum is not None and zlib.crc32(self.items) != layout_checksum:
+            logging.warning(
+                "Seed %s no longer gives the stored %s layout, restarting the game",
+                self.seed,
+                self.score_config_key,
+            )
+            self.revealed = self.permanent = self.matched_groups = 0
+            selection = ()
+            self.last_matched = -1
+            self.start_time = self.last_active = time.time()
+        self.selection = list(selection)
+        self.selected = 0
+        for i in self.selection:
+            self.selected |= 1 << i
+        self.selection_mismatch = any(
+            self.items[i] != self.items[self.selection[0]] for i in self.selection
+        )
+        self.render_cache = None
+        self.rendered_fingerprint = None
+
+    @property
+    def cell_count(self) -> int:
+        return len(self.items)
+
+    @property
+    def unique_item_count(self) -> int:
+        return len(self.items) // self.match_count
+
+    @property
+    def score_config_key(self) -> str:
+        return score_key(self.size_x, self.size_y, self.match_count)
+
+    def cell_id(self, index: int) -> str:
+        """Returns the callback id ("x_y", 1-based) of the cell at index."""
+        return f"{index % self.size_x + 1}_{index // self.size_x + 1}"
+
+    def value(self, index: int) -> str:
+        return self.pool[self.items[index]]
+
+    @property
+    def last_matched_value(self) -> str:
+        return self.pool[self.last_matched] if self.last_matched >= 0 else ""
+
+    @property
+    def visible_mask(self) -> int:
+        return self.revealed | self.permanent
+
+    def is_visible(self, index: int) -> bool:
+        return bool(self.visible_mask >> index & 1)
+
+    def cell_text(self, index: int) -> str:
+        return self.value(index) if self.is_visible(index) else HIDDEN_CELL_TEXT
+
+    def is_won(self) -> bool:
+        return self.matched_groups == len(self.items) // self.match_count
+
+    def elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def idle_time(self) -> float:
+        return time.time() - self.last_active
+
+    def tap(self, index: int) -> int:
+        """Applies a tap on the cell at index and returns one of the TAP_* outcomes."""
+        bit = 1 << index
+        if (self.permanent | self.selected) & bit:
+            return TAP_IGNORED
+
+        self.last_active = time.time()
+        self.revealed |= bit
+        self.selected |= bit
+        self.selection.append(index)
+        if self.items[index] != self.items[self.selection[0]]:
+            self.selection_mismatch = True
+        if len(self.selection) < self.match_count:
+            return TAP_SELECTED
+
+        first_item = self.items[self.selection[0]]
+        selection_mask = self.selected
+        is_match = not self.selection_mismatch
+        self.selection.clear()
+        self.selected = 0
+        self.selection_mismatch = False
+
+        if not is_match:
+            self.revealed &= ~selection_mask
+            return TAP_MISMATCH
+
+        self.permanent |= selection_mask
+        self.matched_groups += 1
+        self.last_matched = first_item
+        return TAP_WON if self.is_won() else TAP_MATCH
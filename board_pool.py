@@ -0,0 +1,93 @@
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Tuple
+
+from engine import Board, new_game
+
+Config = Tuple[int, int, int]
+
+
+class BoardPool:
+    """Keeps freshly shuffled boards of the most requested configs ready.
+
+    take() hands out a pooled board when there is one and shuffles a new
+    board otherwise, then schedules a refill. The refill runs as a task on
+    the event loop and yields after every board, so bursts of game starts
+    only pay for popping a board. Only the max_configs most requested
+    configs among the last window game starts are pooled, each with up to
+    size boards, so the pool follows what is being played right now.
+    """
+
+    def __init__(self, size: int = 16, max_configs: int = 8, window: int = 500) -> None:
+        self.size = size
+        self.max_configs = max_configs
+        self.window = window
+        # Configs of the last window game starts and how often each occurs
+        self.recent: Deque[Config] = deque()
+        self.requests: Counter = Counter()
+        self.stats: Counter = Counter()
+        self._boards: Dict[Config, Deque[Board]] = {}
+        self._refill_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(boards) for boards in self._boards.values())
+
+    def take(self, size_x: int, size_y: int, match_count: int) -> Board | None:
+        """Returns a new board, or None if the config is invalid."""
+        config = (size_x, size_y, match_count)
+        boards = self._boards.get(config)
+        if boards:
+            self.stats["hits"] += 1
+            board = boards.popleft()
+            board.start_time = board.last_active = time.time()
+        else:
+            board = new_game(size_x, size_y, match_count)
+            if board is None:
+                return None
+            self.stats["misses"] += 1
+        self._count_request(config)
+        if self.size > 0:
+            self._schedule_refill()
+        return board
+
+    def _count_request(self, config: Config) -> None:
+        self.recent.append(config)
+        self.requests[config] += 1
+        if len(self.recent) > self.window:
+            oldest = self.recent.popleft()
+            self.requests[oldest] -= 1
+            if not self.requests[oldest]:
+                del self.requests[oldest]
+
+    def popular_configs(self) -> List[Config]:
+        return [config for config, _ in self.requests.most_common(self.max_configs)]
+
+    def _schedule_refill(self) -> None:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self) -> None:
+        """Tops up the pools of the popular configs and drops all others."""
+        popular = self.popular_configs()
+        for config in list(self._boards):
+            if config not in popular:
+                del self._boards[config]
+        for config in popular:
+            boards = self._boards.setdefault(config, deque())
+            while len(boards) < self.size:
+                board = new_game(*config)
+                if board is None:  # only valid configs are ever requested
+                    break
+                boards.append(board)
+                self.stats["generated"] += 1
+                # Let pending updates run between two boards
+                await asyncio.sleep(0)
+
+    async def close(self) -> None:
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
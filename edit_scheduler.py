@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Set
+
+EditFactory = Callable[[], Awaitable[None]]
+
+
+class EditScheduler:
+    """Coalesces message edits that arrive within a short window.
+
+    Edits are keyed per message. The first edit of a message is performed
+    right away. Edits submitted while it is in flight, or within delay
+    seconds after it, wait for the window to end; a newer one replaces an
+    older one, so a burst of taps results in a single edit of the latest
+    state. Edits of one message never overlap. A delay of 0 disables
+    coalescing and performs every edit immediately.
+    """
+
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.coalesced = 0
+        self._pending: Dict[Hashable, EditFactory] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        # Messages whose edit request is in progress
+        self._editing: Set[Hashable] = set()
+        self._flushing = False
+
+    async def submit(self, key: Hashable, factory: EditFactory) -> None:
+        """Schedules factory() to perform the edit of the message identified by key."""
+        if self.delay <= 0:
+            await factory()
+            return
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = factory
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: Hashable) -> None:
+        try:
+            while (factory := self._pending.pop(key, None)) is not None:
+                self._editing.add(key)
+                try:
+                    await factory()
+                except Exception as e:
+                    logging.error("Error performing scheduled edit for %s: %s", key, e)
+                finally:
+                    self._editing.discard(key)
+                if self._flushing:
+                    break
+                await asyncio.sleep(self.delay)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def flush(self) -> None:
+        """Waits for the edits in progress and performs all waiting ones now."""
+        self._flushing = True
+        try:
+            tasks = list(self._tasks.items())
+            for key, task in tasks:
+                if key not in self._editing:
+                    task.cancel()
+            await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+        finally:
+            self._flushing = False
+        pending, self._pending = self._pending, {}
+        for key, factory in pending.items():
+            try:
+                await factory()
+            except Exception as e:
+                logging.error("Error performing scheduled edit for %s: %s", key, e)
@@ -0,0 +1,136 @@
+"""Framework-free game engine API.
+
+Everything a front-end needs to validate a configuration, run a game and
+show its state, without any Telegram imports. The bot's handlers only
+translate updates into these calls and the results into messages, so the
+engine can be benchmarked, run in worker processes (a Board pickles to a
+few hundred bytes) and reused by other front-ends.
+"""
+
+from typing import Iterable, List, Tuple
+
+from board import (
+    EMOJI_POOL,
+    TAP_IGNORED,
+    TAP_MATCH,
+    TAP_MISMATCH,
+    TAP_SELECTED,
+    TAP_WON,
+    Board,
+    score_key,
+)
+
+__all__ = [
+    "TAP_IGNORED",
+    "TAP_SELECTED",
+    "TAP_MATCH",
+    "TAP_MISMATCH",
+    "TAP_WON",
+    "Board",
+    "EMOJI_POOL",
+    "MAX_SIZE_X",
+    "MAX_SIZE_Y",
+    "DIMENSIONS_OK",
+    "DIMENSIONS_OUT_OF_RANGE",
+    "DIMENSIONS_TOO_FEW_CELLS",
+    "DIMENSIONS_TOO_MANY_CELLS",
+    "MATCH_COUNT_OK",
+    "MATCH_COUNT_OUT_OF_RANGE",
+    "MATCH_COUNT_NOT_DIVISOR",
+    "MATCH_COUNT_TOO_FEW_GROUPS",
+    "MATCH_COUNT_TOO_MANY_GROUPS",
+    "check_dimensions",
+    "check_match_count",
+    "new_game",
+    "replay",
+    "tap",
+    "is_won",
+    "render_state",
+    "score_key",
+]
+
+MAX_SIZE_X, MAX_SIZE_Y = 8, 9
+
+# Results of check_dimensions
+(
+    DIMENSIONS_OK,
+    DIMENSIONS_OUT_OF_RANGE,
+    DIMENSIONS_TOO_FEW_CELLS,
+    DIMENSIONS_TOO_MANY_CELLS,
+) = range(4)
+
+# Results of check_match_count
+(
+    MATCH_COUNT_OK,
+    MATCH_COUNT_OUT_OF_RANGE,
+    MATCH_COUNT_NOT_DIVISOR,
+    MATCH_COUNT_TOO_FEW_GROUPS,
+    MATCH_COUNT_TOO_MANY_GROUPS,
+) = range(5)
+
+
+def check_dimensions(size_x: int, size_y: int) -> int:
+    """Returns DIMENSIONS_OK or why a size_x by size_y board cannot be played."""
+    if not (0 < size_x <= MAX_SIZE_X and 0 < size_y <= MAX_SIZE_Y):
+        return DIMENSIONS_OUT_OF_RANGE
+    if size_x * size_y < 2:
+        return DIMENSIONS_TOO_FEW_CELLS
+    if size_x * size_y > len(EMOJI_POOL) * 10:
+        return DIMENSIONS_TOO_MANY_CELLS
+    return DIMENSIONS_OK
+
+
+def check_match_count(size_x: int, size_y: int, match_count: int) -> int:
+    """Returns MATCH_COUNT_OK or why match_count does not fit the board."""
+    total_cells = size_x * size_y
+    if not (1 < match_count <= total_cells):
+        return MATCH_COUNT_OUT_OF_RANGE
+    if total_cells % match_count != 0:
+        return MATCH_COUNT_NOT_DIVISOR
+    if total_cells // match_count <= 1:
+        return MATCH_COUNT_TOO_FEW_GROUPS
+    if total_cells // match_count > len(EMOJI_POOL):
+        return MATCH_COUNT_TOO_MANY_GROUPS
+    return MATCH_COUNT_OK
+
+
+def new_game(
+    size_x: int, size_y: int, match_count: int, seed: int | None = None
+) -> Board | None:
+    """Starts a game shuffled with seed, or returns None for an invalid config.
+
+    The same config and seed always give the same layout. A random seed is
+    drawn if none is given.
+    """
+    return Board.new(size_x, size_y, match_count, seed)
+
+
+def replay(
+    size_x: int, size_y: int, match_count: int, seed: int, taps: Iterable[int]
+) -> Tuple[Board, List[int]] | None:
+    """Replays a game from its config, seed and tapped cell indices.
+
+    Returns the resulting board and the outcome of every tap, or None for an
+    invalid config. Meant for reproducing reported games while debugging.
+    """
+    board = Board.new(size_x, size_y, match_count, seed)
+    if board is None:
+        return None
+    return board, [board.tap(index) for index in taps]
+
+
+def tap(board: Board, index: int) -> int:
+    """Applies a tap on the cell at index and returns one of the TAP_* outcomes."""
+    return board.tap(index)
+
+
+def is_won(board: Board) -> bool:
+    return board.is_won()
+
+
+def render_state(board: Board) -> List[List[str]]:
+    """Returns the text of every cell, row by row, as the player sees it."""
+    return [
+        [board.cell_text(row * board.size_x + x) for x in range(board.size_x)]
+        for row in range(board.size_y)
+    ]
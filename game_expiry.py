@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
+
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from board import Board
+from metrics import GAMES_EXPIRED
+from persistence import SQLitePersistence
+
+EXPIRED_TEXT = (
+    "⌛ این بازی به دلیل عدم فعالیت منقضی شد. برای بازی جدید /start را بزنید."
+)
+
+# Stored user_data rows of paged out users checked per sweep, so that a full
+# pass over a large table is spread over several sweeps
+PAGED_OUT_ROWS_PER_SWEEP = 5000
+
+# Per-cell game state stored by versions before Board, no longer read by anything
+LEGACY_GAME_KEYS = (
+    "board_cells",
+    "game_items",
+    "current_selection",
+    "matched_values",
+    "game_start_time",
+)
+
+
+def drop_legacy_game_state(user_data: Dict[Any, Any]) -> bool:
+    """Removes the pre-Board game state from user_data, returning True if any."""
+    dropped = False
+    for key in LEGACY_GAME_KEYS:
+        if user_data.pop(key, None) is not None:
+            dropped = True
+    return dropped
+
+
+class GameExpiry:
+    """Frees the state of games nobody has touched for ttl seconds.
+
+    sweep() removes idle boards, and the game state left over from versions
+    before Board, from user_data, marks the users for the next persistence
+    flush and replaces the board message of unfinished games with an expiry
+    notice. With lazy SQLite persistence, the stored rows of users that are
+    not in memory are checked too, a slice of the table per sweep. The
+    notices are sent batch_size at a time with batch_interval seconds in
+    between, so a sweep after a quiet night does not eat the flood limit
+    needed by active players.
+    """
+
+    def __init__(
+        self, ttl: float, batch_size: int = 20, batch_interval: float = 1
+    ) -> None:
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+    def _expire(
+        self, user_id: int, user_data: Dict[Any, Any], notices: List[Tuple[int, Any]]
+    ) -> bool:
+        """Frees the state of an idle game in user_data, returning True if any."""
+        changed = drop_legacy_game_state(user_data)
+        board = user_data.get("board")
+        if isinstance(board, Board) and board.idle_time() >= self.ttl:
+            del user_data["board"]
+            message = user_data.pop("board_message", None)
+            changed = True
+            if not board.is_won():
+                GAMES_EXPIRED.inc(config=board.score_config_key)
+                if message is not None:
+                    notices.append((user_id, message))
+        return changed
+
+    def collect_expired(self, application: Application) -> List[Tuple[int, Any]]:
+        """Removes idle boards and returns the users and board messages to notify."""
+        notices: List[Tuple[int, Any]] = []
+        changed_users = [
+            user_id
+            for user_id, user_data in application.user_data.items()
+            if self._expire(user_id, user_data, notices)
+        ]
+        if changed_users:
+            application.mark_data_for_update_persistence(user_ids=changed_users)
+        return notices
+
+    async def collect_expired_paged_out(
+        self, persistence: SQLitePersistence
+    ) -> List[Tuple[int, Any]]:
+        """Like collect_expired, for users that lazy persistence keeps on disk only."""
+        notices: List[Tuple[int, Any]] = []
+        await persistence.update_paged_out_user_data(
+            lambda user_id, data: self._expire(user_id, data, notices),
+            PAGED_OUT_ROWS_PER_SWEEP,
+        )
+        return notices
+
+    async def _notify(
+        self, application: Application, user_id: int, message: Tuple[int, int]
+    ) -> None:
+        chat_id, message_id = message
+        try:
+            await application.bot.edit_message_text(
+                text=EXPIRED_TEXT, chat_id=chat_id, message_id=message_id
+            )
+        except TelegramError as e:
+            # Usually the message is gone or too old to edit, nothing to do
+            logging.debug("Could not mark game of user %s as expired: %s", user_id, e)
+
+    async def sweep(self, application: Application) -> int:
+        """Expires idle games and returns how many notices were sent."""
+        notices = self.collect_expired(application)
+        if isinstance(application.persistence, SQLitePersistence):
+            notices += await self.collect_expired_paged_out(application.persistence)
+        for start in range(0, len(notices), self.batch_size):
+            if start:
+                await asyncio.sleep(self.batch_interval)
+            await asyncio.gather(
+                *(
+                    self._notify(application, user_id, message)
+                    for user_id, message in notices[start : start + self.batch_size]
+                )
+            )
+        if notices:
+            logging.info("Expired %s idle games", len(notices))
+        return len(notices)
+
+    async def run(self, application: Application, interval: float) -> None:
+        """Sweeps every interval seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep(application)
+            except Exception as e:
+                logging.error("Error expiring idle games: %s", e)
@@ -0,0 +1,152 @@
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from board import HIDDEN_CELL_TEXT, Board
+
+
+SCORES_CALLBACK_PREFIX = "scores:"
+
+# Outcomes of board message edits: "sent", "skipped" and "failed"
+EDIT_COUNTERS: Counter = Counter()
+
+
+class KeyboardTemplate:
+    """Precomputed callback ids and buttons for one board shape.
+
+    Buttons are immutable, so the hidden button of every cell and each
+    revealed (cell, emoji) button are built once per shape and shared by all
+    games of that shape.
+    """
+
+    __slots__ = (
+        "size_x",
+        "size_y",
+        "callback_ids",
+        "index_by_callback",
+        "hidden_buttons",
+        "_revealed_buttons",
+    )
+
+    def __init__(self, size_x: int, size_y: int) -> None:
+        self.size_x = size_x
+        self.size_y = size_y
+        self.callback_ids: Tuple[str, ...] = tuple(
+            f"{x}_{y}" for y in range(1, size_y + 1) for x in range(1, size_x + 1)
+        )
+        self.index_by_callback: Dict[str, int] = {
+            cell_id: index for index, cell_id in enumerate(self.callback_ids)
+        }
+        self.hidden_buttons: Tuple[InlineKeyboardButton, ...] = tuple(
+            InlineKeyboardButton(HIDDEN_CELL_TEXT, callback_data=cell_id)
+            for cell_id in self.callback_ids
+        )
+        self._revealed_buttons: Dict[Tuple[int, str], InlineKeyboardButton] = {}
+
+    def button(self, board: Board, index: int, visible: bool) -> InlineKeyboardButton:
+        if not visible:
+            return self.hidden_buttons[index]
+        key = (index, board.value(index))
+        button = self._revealed_buttons.get(key)
+        if button is None:
+            button = InlineKeyboardButton(
+                key[1], callback_data=self.callback_ids[index]
+            )
+            self._revealed_buttons[key] = button
+        return button
+
+
+class RenderedKeyboard:
+    """The last keyboard rendered for a board, kept in Board.render_cache."""
+
+    __slots__ = ("template", "visible", "rows", "markup")
+
+    def __init__(
+        self,
+        template: KeyboardTemplate,
+        visible: int,
+        rows: List[List[InlineKeyboardButton]],
+        markup: InlineKeyboardMarkup,
+    ) -> None:
+        self.template = template
+        self.visible = visible
+        self.rows = rows
+        self.markup = markup
+
+
+@lru_cache(maxsize=None)
+def get_template(size_x: int, size_y: int) -> KeyboardTemplate:
+    return KeyboardTemplate(size_x, size_y)
+
+
+def callback_cell_index(board: Board, cell_id: str | None) -> int | None:
+    """Returns the cell index for a callback id, or None if it is invalid."""
+    if cell_id is None:
+        return None
+    return get_template(board.size_x, board.size_y).index_by_callback.get(cell_id)
+
+
+def render_keyboard(board: Board) -> InlineKeyboardMarkup:
+    """Returns the keyboard for board, only replacing buttons changed since the last render."""
+    template = get_template(board.size_x, board.size_y)
+    visible = board.visible_mask
+    cached = board.render_cache
+
+    if isinstance(cached, RenderedKeyboard) and cached.template is template:
+        changed = visible ^ cached.visible
+        if not changed:
+            return cached.markup
+        rows = cached.rows
+        size_x = template.size_x
+        while changed:
+            low_bit = changed & -changed
+            index = low_bit.bit_length() - 1
+            rows[index // size_x][index % size_x] = template.button(
+                board, index, bool(visible & low_bit)
+            )
+            changed ^= low_bit
+    else:
+        rows = []
+        index = 0
+        for _ in range(template.size_y):
+            row = []
+            for _ in range(template.size_x):
+                row.append(template.button(board, index, bool(visible >> index & 1)))
+                index += 1
+            rows.append(row)
+
+    markup = InlineKeyboardMarkup(rows)
+    board.render_cache = RenderedKeyboard(template, visible, rows, markup)
+    return markup
+
+
+def scores_page_keyboard(page: int, page_count: int) -> InlineKeyboardMarkup | None:
+    """Returns the navigation buttons of a /scores page, or None for a single page."""
+    if page_count <= 1:
+        return None
+    row = []
+    if page > 0:
+        row.append(
+            InlineKeyboardButton(
+                "◀️", callback_data=f"{SCORES_CALLBACK_PREFIX}{page - 1}"
+            )
+        )
+    row.append(
+        InlineKeyboardButton(
+            f"{page + 1}/{page_count}", callback_data=f"{SCORES_CALLBACK_PREFIX}{page}"
+        )
+    )
+    if page < page_count - 1:
+        row.append(
+            InlineKeyboardButton(
+                "▶️", callback_data=f"{SCORES_CALLBACK_PREFIX}{page + 1}"
+            )
+        )
+    return InlineKeyboardMarkup([row])
+
+
+def render_fingerprint(board: Board, text: str) -> Tuple[int, int]:
+    """Returns a cheap fingerprint of what the board message shows."""
+    return (board.visible_mask, hash(text))
@@ -0,0 +1,174 @@
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Tuple, TypedDict
+
+ScoreEntry = TypedDict("ScoreEntry", {"name": str, "time": float})
+
+SCORES_HEADER = "🏆 **جدول امتیازات برتر** 🏆\n\n"
+SCORES_PAGE_SIZE = 5  # Configurations per /scores page
+
+# Heap items are (-time, -sequence, name) so heap[0] is the slowest entry and,
+# among equal times, the most recent one is evicted first.
+HeapItem = Tuple[float, int, str]
+
+
+def format_config_name(config_key: str) -> str:
+    """Formats a config key for display (e.g., "3x3_match3" -> "3x3 (تطابق 3)")."""
+    try:
+        dims, match_val_str = config_key.split("_match")
+        match_val = int(match_val_str)
+        return f"{dims} (تطابق {match_val})"
+    except ValueError:
+        return config_key.replace("_match", " - تطابق ")
+
+
+def format_section(config_key: str, scores: List[ScoreEntry]) -> str:
+    section = f"🕹️ **{format_config_name(config_key)}**:\n"
+    for i, score_entry in enumerate(scores):
+        section += (
+            f"  {i + 1}. {score_entry['name']}: {score_entry['time']:.2f} ثانیه\n"
+        )
+    return section + "\n"
+
+
+class Leaderboard:
+    """Bounded high score tables, one max-heap per game configuration.
+
+    Kept outside bot_data and saved to its own JSON file, so recording a
+    score never re-pickles user state. Configurations are kept in a sorted
+    index for paging, and the Markdown rendering of each table and page is
+    cached and only invalidated where a configuration changed.
+    """
+
+    def __init__(self, max_entries: int, filepath: str | None = None) -> None:
+        self.max_entries = max_entries
+        self.filepath = filepath
+        self.dirty = False
+        self._heaps: Dict[str, List[HeapItem]] = {}
+        self._sequence = itertools.count()
+        self._configs: List[str] = []  # Sorted index of configurations
+        self._sections: Dict[str, str] = {}
+        self._pages: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._heaps)
+
+    def __contains__(self, config_key: str) -> bool:
+        return config_key in self._heaps
+
+    def configs(self) -> List[str]:
+        return list(self._configs)
+
+    def qualifies(self, config_key: str, time_taken: float) -> bool:
+        """Returns whether time_taken would make it into the table."""
+        heap = self._heaps.get(config_key)
+        if heap is None or len(heap) < self.max_entries:
+            return True
+        return time_taken < -heap[0][0]
+
+    def add(self, config_key: str, name: str, time_taken: float) -> bool:
+        """Records a score, returning False if it is slower than the whole table."""
+        if not self.qualifies(config_key, time_taken):
+            return False
+        item = (-time_taken, -next(self._sequence), name)
+        heap = self._heaps.get(config_key)
+        if heap is None:
+            heap = self._heaps[config_key] = []
+            position = bisect.bisect_left(self._configs, config_key)
+            self._configs.insert(position, config_key)
+            # Every page from this one on shifts by one configuration
+            first_page = position // SCORES_PAGE_SIZE
+            for page in [page for page in self._pages if page >= first_page]:
+                del self._pages[page]
+        else:
+            position = bisect.bisect_left(self._configs, config_key)
+            self._pages.pop(position // SCORES_PAGE_SIZE, None)
+
+        if len(heap) < self.max_entries:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+        self.dirty = True
+        self._sections.pop(config_key, None)
+        return True
+
+    def top(self, config_key: str, n: int | None = None) -> List[ScoreEntry]:
+        """Returns the n fastest entries of a configuration, fastest first."""
+        heap = self._heaps.get(config_key, [])
+        items = heapq.nlargest(n if n is not None else len(heap), heap)
+        return [{"name": name, "time": -neg_time} for neg_time, _, name in items]
+
+    def section_text(self, config_key: str) -> str:
+        section = self._sections.get(config_key)
+        if section is None:
+            section = format_section(config_key, self.top(config_key))
+            self._sections[config_key] = section
+        return section
+
+    def config_text(self, config_key: str) -> str | None:
+        """Returns the rendered table of one configuration, or None if it has no scores."""
+        if config_key not in self._heaps:
+            return None
+        return SCORES_HEADER + self.section_text(config_key)
+
+    @property
+    def page_count(self) -> int:
+        return -(-len(self._configs) // SCORES_PAGE_SIZE)
+
+    def page_text(self, page: int) -> str | None:
+        """Returns the rendered /scores page (0-based), or None if it does not exist."""
+        if not 0 <= page < self.page_count:
+            return None
+        text = self._pages.get(page)
+        if text is None:
+            start = page * SCORES_PAGE_SIZE
+            text = SCORES_HEADER + "".join(
+                self.section_text(config_key)
+                for config_key in self._configs[start : start + SCORES_PAGE_SIZE]
+            )
+            self._pages[page] = text
+        return text
+
+    def as_dict(self) -> Dict[str, List[ScoreEntry]]:
+        return {config_key: self.top(config_key) for config_key in self._configs}
+
+    def update_from(self, tables: Dict[str, Iterable]) -> None:
+        """Merges tables in the legacy bot_data format ({config: [entry, ...]})."""
+        for config_key, scores in tables.items():
+            if not isinstance(scores, list):  # Skip non-score data
+                continue
+            for score_entry in scores:
+                if (
+                    isinstance(score_entry, dict)
+                    and "name" in score_entry
+                    and "time" in score_entry
+                ):
+                    self.add(config_key, score_entry["name"], score_entry["time"])
+                else:
+                    logging.warning(
+                        "Malformed score entry for %s: %s", config_key, score_entry
+                    )
+
+    def load(self) -> bool:
+        """Loads the tables from filepath, returning False if there is no file yet."""
+        if not self.filepath or not os.path.exists(self.filepath):
+            return False
+        with open(self.filepath, encoding="utf-8") as f:
+            self.update_from(json.load(f))
+        self.dirty = False
+        return True
+
+    def save(self) -> None:
+        """Atomically writes the tables to filepath if they changed."""
+        if not self.filepath or not self.dirty:
+            return
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.filepath)
+        # Only now, so that a failed write is retried on the next save
+        self.dirty = False
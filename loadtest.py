@@ -0,0 +1,377 @@
+"""Synthetic load test for the bot.
+
+Builds the Application exactly as main.py does, but with a stub request
+backend that records Bot API calls instead of sending them to Telegram, and
+feeds it fabricated updates from N simulated players. Arguments after "--"
+are passed to main.py's parser, e.g.:
+
+    python loadtest.py --players 2000 -- --workers 16 --edit-delay 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import count
+from typing import Any, Dict, List, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import BaseRequest, RequestData
+
+import main
+from board import Board
+from persistence import SQLitePersistence
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "LoadTest",
+    "username": "load_test_bot",
+}
+FIRST_USER_ID = 1000
+
+
+class StubRequest(BaseRequest):
+    """Request backend answering Bot API calls locally after a simulated round trip."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = count(1)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: Any = None,
+        write_timeout: Any = None,
+        connect_timeout: Any = None,
+        pool_timeout: Any = None,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        parameters = request_data.parameters if request_data else {}
+        result: Any = True
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": parameters.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": parameters["chat_id"], "type": "private"},
+                "text": parameters.get("text", ""),
+            }
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class TimedApplication(Application):
+    """Application recording how long each update takes to process."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.enqueued_at: Dict[int, float] = {}
+        self.handler_latencies: List[float] = []
+        self.end_to_end_latencies: List[float] = []
+
+    async def process_update(self, update: object) -> None:
+        started = time.perf_counter()
+        try:
+            await super().process_update(update)
+        finally:
+            finished = time.perf_counter()
+            self.handler_latencies.append(finished - started)
+            if isinstance(update, Update):
+                enqueued = self.enqueued_at.pop(update.update_id, None)
+                if enqueued is not None:
+                    self.end_to_end_latencies.append(finished - enqueued)
+
+
+class Player:
+    """A simulated player configuring and playing games through fabricated updates."""
+
+    def __init__(
+        self, application: TimedApplication, user_id: int, args: argparse.Namespace
+    ) -> None:
+        self.application = application
+        self.user_id = user_id
+        self.args = args
+        self.rng = random.Random(user_id)
+        self.games_won = 0
+
+    def _user(self) -> Dict[str, Any]:
+        return {
+            "id": self.user_id,
+            "is_bot": False,
+            "first_name": f"Player{self.user_id}",
+        }
+
+    def _chat(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "type": "private"}
+
+    async def _send(self, payload: Dict[str, Any]) -> int:
+        update_id = next(UPDATE_IDS)
+        payload["update_id"] = update_id
+        update = Update.de_json(payload, self.application.bot)
+        self.application.enqueued_at[update_id] = time.perf_counter()
+        await self.application.update_queue.put(update)
+        return update_id
+
+    async def wait_processed(self, update_id: int) -> None:
+        while update_id in self.application.enqueued_at:
+            await asyncio.sleep(0.01)
+
+    async def send_text(self, text: str) -> int:
+        message: Dict[str, Any] = {
+            "message_id": next(UPDATE_IDS),
+            "date": int(time.time()),
+            "chat": self._chat(),
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return await self._send({"message": message})
+
+    async def send_tap(self, board: Board, index: int) -> int:
+        callback_query = {
+            "id": str(next(UPDATE_IDS)),
+            "from": self._user(),
+            "chat_instance": str(self.user_id),
+            "data": board.cell_id(index),
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": self._chat(),
+                "text": "",
+            },
+        }
+        return await self._send({"callback_query": callback_query})
+
+    async def think(self) -> None:
+        await asyncio.sleep(self.rng.uniform(self.args.think_min, self.args.think_max))
+
+    async def wait_for_board(self, previous: Board | None) -> Board | None:
+        deadline = time.monotonic() + self.args.timeout
+        while time.monotonic() < deadline:
+            board = self.application.user_data[self.user_id].get("board")
+            if isinstance(board, Board) and board is not previous:
+                return board
+            await asyncio.sleep(0.05)
+        return None
+
+    async def current_board(self) -> Board | None:
+        """Returns the board as left by the last processed update.
+
+        A user paged out by lazy persistence has empty user_data until their
+        next update, so the board is read from persistence then.
+        """
+        user_data = self.application.user_data[self.user_id]
+        persistence = self.application.persistence
+        if not user_data and isinstance(persistence, SQLitePersistence):
+            blob = await persistence._load_user_row(self.user_id)
+            user_data = pickle.loads(blob) if blob is not None else {}
+        board = user_data.get("board")
+        return board if isinstance(board, Board) else None
+
+    def choose_cell(self, board: Board) -> int:
+        hidden = [
+            index
+            for index in range(board.cell_count)
+            if not (board.permanent | board.selected) >> index & 1
+        ]
+        if board.selection and self.rng.random() < self.args.skill:
+            wanted = board.items[board.selection[0]]
+            for index in hidden:
+                if board.items[index] == wanted:
+                    return index
+        return self.rng.choice(hidden)
+
+    async def play(self) -> None:
+        board: Board | None = None
+        for _ in range(self.args.games):
+            x, y, match_count = self.rng.choice(self.args.configs)
+            await self.send_text("/start")
+            await self.think()
+            await self.send_text(f"{x}x{y}")
+            await self.think()
+            await self.send_text(str(match_count))
+            board = await self.wait_for_board(board)
+            if board is None:
+                logging.error("Player %s never got a board", self.user_id)
+                return
+
+            taps = 0
+            while not board.is_won() and taps < self.args.max_taps:
+                await self.think()
+                # Look at the board again only once the tap was applied
+                await self.wait_processed(
+                    await self.send_tap(board, self.choose_cell(board))
+                )
+                taps += 1
+                board = await self.current_board()
+                if board is None:
+                    logging.error("Player %s lost the board", self.user_id)
+                    return
+            if board.is_won():
+                self.games_won += 1
+                if self.rng.random() < self.args.scores_ratio:
+                    await self.send_text("/scores")
+
+
+UPDATE_IDS = count(1)
+
+
+def percentiles(samples: List[float]) -> str:
+    if len(samples) < 2:
+        return "n/a"
+    values = statistics.quantiles(
+        [s * 1000 for s in samples], n=100, method="inclusive"
+    )
+    return f"p50 {values[49]:.2f} ms, p90 {values[89]:.2f} ms, p99 {values[98]:.2f} ms"
+
+
+async def run(args: argparse.Namespace, bot_args: List[str]) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        main_args = main.build_parser().parse_args(
+            [
+                "--token",
+                "1:LOADTEST",
+                "--persistence-file",
+                f"{tmp_dir}/persistence",
+                "--leaderboard-file",
+                f"{tmp_dir}/leaderboard.json",
+            ]
+            + bot_args
+        )
+        request = StubRequest(args.latency)
+        builder = (
+            ApplicationBuilder()
+            .token(main_args.token)
+            .application_class(TimedApplication)
+            .request(request)
+            .get_updates_request(StubRequest(0))
+            .updater(None)
+        )
+        application = main.build_application(main_args, builder)
+        assert isinstance(application, TimedApplication)
+
+        async with application:
+            await application.start()
+            players = [
+                Player(application, FIRST_USER_ID + i, args)
+                for i in range(args.players)
+            ]
+            started = time.perf_counter()
+            await asyncio.gather(*(player.play() for player in players))
+            while application.enqueued_at:
+                await asyncio.sleep(0.05)
+            duration = time.perf_counter() - started
+            await application.stop()
+            await main.edit_scheduler.flush()
+
+    processed = len(application.handler_latencies)
+    print(f"players:            {args.players}")
+    print(f"games won:          {sum(player.games_won for player in players)}")
+    print(
+        f"updates processed:  {processed} in {duration:.2f}s ({processed / duration:.1f}/s)"
+    )
+    print(f"handler latency:    {percentiles(application.handler_latencies)}")
+    print(f"end-to-end latency: {percentiles(application.end_to_end_latencies)}")
+    print("outbound calls:")
+    for endpoint, calls in request.calls.most_common():
+        print(f"  {endpoint:<20} {calls}")
+    print(f"board edits:        {dict(main.EDIT_COUNTERS)}")
+
+
+def parse_config(value: str) -> Tuple[int, int, int]:
+    dims, match_count = value.split(":")
+    x, y = dims.lower().split("x")
+    return int(x), int(y), int(match_count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent players against the bot without Telegram."
+    )
+    parser.add_argument("--players", type=int, default=100, help="Default is 100.")
+    parser.add_argument(
+        "--games", type=int, default=1, help="Games per player. Default is 1."
+    )
+    parser.add_argument(
+        "--configs",
+        type=parse_config,
+        nargs="+",
+        default=[(4, 4, 2), (3, 4, 3), (6, 6, 2)],
+        help="Board configurations players pick from, as XxY:match. "
+        "Default is 4x4:2 3x4:3 6x6:2.",
+    )
+    parser.add_argument(
+        "--think-min",
+        type=float,
+        default=0.2,
+        help="Minimum seconds between two actions of a player. Default is 0.2.",
+    )
+    parser.add_argument(
+        "--think-max",
+        type=float,
+        default=0.8,
+        help="Maximum seconds between two actions of a player. Default is 0.8.",
+    )
+    parser.add_argument(
+        "--skill",
+        type=float,
+        default=0.6,
+        help="Probability that a player completes a group it started. Default is 0.6.",
+    )
+    parser.add_argument(
+        "--max-taps", type=int, default=500, help="Give up a game after this many taps."
+    )
+    parser.add_argument(
+        "--scores-ratio",
+        type=float,
+        default=0.5,
+        help="Share of won games followed by /scores. Default is 0.5.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Simulated Bot API round trip in seconds. Default is 0.05.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="Seconds a player waits for its board. Default is 30.",
+    )
+    argv = sys.argv[1:]
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args, argv[split + 1 :]))
@@ -0,0 +1,117 @@
+import json
+import logging
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Tuple
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Libraries logging every request at INFO, kept at WARNING unless debugging
+NOISY_LOGGERS = ("httpx", "httpcore")
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most limit records per window seconds through per call site.
+
+    Records are keyed by the logger and the line they were logged from, so a
+    handler failing on every update logs a few times per window instead of
+    once per update. The first record let through in the next window carries
+    the number of records dropped in between as its suppressed attribute.
+    """
+
+    def __init__(self, limit: int = 10, window: float = 60, max_keys: int = 1024):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # Per key: [window start, records passed, records suppressed]
+        self._windows: Dict[Tuple[str, str, int], List[Any]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        entry = self._windows.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            if entry is None and len(self._windows) >= self.max_keys:
+                self._windows = {
+                    k: e for k, e in self._windows.items() if now - e[0] < self.window
+                }
+            if entry is not None and entry[2]:
+                record.suppressed = entry[2]
+            self._windows[key] = [now, 1, 0]
+            return True
+        if entry[1] < self.limit:
+            entry[1] += 1
+            return True
+        entry[2] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" ({record.suppressed} similar messages suppressed)"
+        return text
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records without formatting them.
+
+    QueueHandler.prepare() renders the message in the logging thread, which
+    is the event loop. The records only cross threads within this process,
+    so they are queued as they are and formatted by the listener instead.
+    Arguments are therefore rendered a little later than they were logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = "INFO", log_format: str = "json") -> QueueListener:
+    """Routes all logging through a queue to a stderr writer thread.
+
+    Returns the started listener, which has to be stopped on exit to write
+    out the remaining records.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(
+        JsonFormatter() if log_format == "json" else TextFormatter(TEXT_FORMAT)
+    )
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    if logging.getLevelName(level) > logging.DEBUG:
+        for name in NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
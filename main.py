@@ -1,13 +1,28 @@
+import asyncio
 import logging
-import random
 import re
-import time
 import argparse
-from typing import TypedDict, Dict, List, cast
+import atexit
+import sys
+import time
+from typing import Callable, Dict, List, Set, Tuple
+
+# Timestamps of the startup phases, reported with --startup-report
+startup_marks: Dict[str, float] = {"started": time.perf_counter()}
+
+# telegram.ext imports PTB's tornado based webhook server whenever tornado is
+# installed, a good share of the import time. Polling never uses it, so it
+# is kept out unless the bot is started in webhook mode.
+if __name__ == "__main__" and not any("webhook" in arg for arg in sys.argv[1:]):
+    sys.modules["tornado"] = None  # type: ignore[assignment]
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram import Update, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
+    BasePersistence,
+    BaseUpdateProcessor,
     ContextTypes,
     CommandHandler,
     MessageHandler,
@@ -15,104 +30,80 @@ from telegram.ext import (
     CallbackQueryHandler,
     ConversationHandler,
     PicklePersistence,
+    SimpleUpdateProcessor,
 )
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+from board_pool import BoardPool
+from edit_scheduler import EditScheduler
+from engine import (
+    DIMENSIONS_OK,
+    DIMENSIONS_OUT_OF_RANGE,
+    DIMENSIONS_TOO_FEW_CELLS,
+    EMOJI_POOL,
+    MATCH_COUNT_NOT_DIVISOR,
+    MATCH_COUNT_OK,
+    MATCH_COUNT_OUT_OF_RANGE,
+    MATCH_COUNT_TOO_FEW_GROUPS,
+    TAP_IGNORED,
+    TAP_MATCH,
+    TAP_MISMATCH,
+    TAP_WON,
+    Board,
+    check_dimensions,
+    check_match_count,
+    score_key,
+    tap,
 )
+from keyboard import (
+    EDIT_COUNTERS,
+    SCORES_CALLBACK_PREFIX,
+    callback_cell_index,
+    render_fingerprint,
+    render_keyboard,
+    scores_page_keyboard,
+)
+from leaderboard import Leaderboard
+from game_expiry import GameExpiry
+from logging_setup import setup_logging
+from metrics import (
+    GAMES_STARTED,
+    GAMES_WON,
+    REGISTRY,
+    MetricFamily,
+    counter_family,
+    gauge_family,
+    start_metrics_server,
+    timed,
+)
+from persistence import SQLitePersistence
+from rate_limiter import TokenBucketRateLimiter
+from tracing import Tracer, TracingRateLimiter, TracingUpdateProcessor, segment
+from update_processor import PerUserUpdateProcessor
+
+startup_marks["imported"] = time.perf_counter()
 
 # State definitions for ConversationHandler
 CHOOSE_DIMENSIONS, CHOOSE_MATCH_COUNT = range(2)
 MAX_HIGH_SCORES_PER_CONFIG = (
     10  # Max number of high scores to store per game configuration
 )
+GAME_EXPIRY_SWEEP_INTERVAL = 60  # Seconds between two scans for idle games
 
-# Emoji pool for dynamic item generation
-EMOJI_POOL = [
-    "🍓",
-    "🍌",
-    "🍉",
-    "🍇",
-    "🥝",
-    "🍍",
-    "🍑",
-    "🍒",
-    "🥭",
-    "🥥",
-    "🥑",
-    "🍆",
-    "🍅",
-    "🌶️",
-    "🥕",
-    "🌽",
-    "🥦",
-    "🍄",
-    "🥜",
-    "🌰",
-    "🍞",
-    "🥐",
-    "🥨",
-    "🥯",
-    "🥞",
-    "🧇",
-    "🧀",
-    "🍖",
-    "🍗",
-    "🥩",
-    "🍔",
-    "🍟",
-    "🍕",
-    "🌭",
-    "🥪",
-    "🌮",
-]
-
-
-CellInfo = TypedDict(
-    "CellInfo", {"value": str, "revealed": bool, "permanently_revealed": bool}
-)
-
-SelectedItem = TypedDict("SelectedItem", {"id": str, "value": str})
-
-BoardCells = Dict[str, CellInfo]
-
-
-def generate_dynamic_items(
-    board_size_x: int, board_size_y: int, match_count: int
-) -> List[str] | None:
-    """Generates the list of items based on board size and match count."""
-    total_cells = board_size_x * board_size_y
-    if total_cells % match_count != 0:
-        logging.error("Total cells not divisible by match count.")
-        return None  # Should be caught by earlier validation
-
-    num_unique_item_sets = total_cells // match_count
-    if (
-        num_unique_item_sets <= 1 and total_cells > 0
-    ):  # Need at least 2 unique sets for a game
-        logging.warning(
-            f"Not enough unique item sets possible: {num_unique_item_sets} for {total_cells} cells and {match_count} match_count."
-        )
-        return None
-
-    if num_unique_item_sets > len(EMOJI_POOL):
-        logging.warning(
-            "Not enough emojis in EMOJI_POOL for the required number of unique items."
-        )
-        return None  # Not enough unique emojis
-
-    items = []
-    for i in range(num_unique_item_sets):
-        items.extend([EMOJI_POOL[i]] * match_count)
-
-    random.shuffle(items)
-    return items
+leaderboard = Leaderboard(MAX_HIGH_SCORES_PER_CONFIG)
+background_tasks: Set[asyncio.Task] = set()
+edit_scheduler = EditScheduler()
+board_pool = BoardPool()
+metrics_address: Tuple[str, int] | None = None
+metrics_servers: List[asyncio.AbstractServer] = []
+game_expiry: GameExpiry | None = None
+tracer: Tracer | None = None
+startup_report = False
 
 
 def get_initial_board_state(
     context: ContextTypes.DEFAULT_TYPE,
-) -> BoardCells | None:  # Now takes context
-    """Initializes and returns a new board state using parameters from context."""
+) -> Board | None:  # Now takes context
+    """Initializes and returns a new board using parameters from context."""
     if context.user_data is None:  # Should be initialized by PTB
         logging.error("user_data is None in get_initial_board_state")
         return None
@@ -131,70 +122,28 @@ def get_initial_board_state(
         )
         return None
 
-    items = generate_dynamic_items(board_size_x, board_size_y, match_count)
-    if items is None:
+    with segment("game"):
+        board = board_pool.take(board_size_x, board_size_y, match_count)
+    if board is None:
         logging.error("Failed to generate dynamic items for the board.")
         return None
-
-    context.user_data["game_items"] = items
-
-    board_cells: BoardCells = {}
-    idx = 0
-    # Cast is safe here due to the isinstance checks above
-    for y in range(1, cast(int, board_size_y) + 1):
-        for x in range(1, cast(int, board_size_x) + 1):
-            cell_id = f"{x}_{y}"
-            if idx < len(items):
-                board_cells[cell_id] = {
-                    "value": items[idx],
-                    "revealed": False,
-                    "permanently_revealed": False,
-                }
-                idx += 1
-            else:
-                # This should not happen if total_cells % match_count == 0 and items are generated correctly
-                logging.error("Mismatch between generated items and board cells.")
-                return None
-    return board_cells
+    return board
 
 
 def generate_keyboard(
     context: ContextTypes.DEFAULT_TYPE,
 ) -> InlineKeyboardMarkup | None:  # Now takes context
-    """Generates the InlineKeyboardMarkup based on the current board_cells state."""
+    """Generates the InlineKeyboardMarkup based on the current board state."""
     if context.user_data is None:
         logging.error("user_data is None in generate_keyboard")
         return None
 
-    board_cells = context.user_data.get("board_cells")
-    board_size_x = context.user_data.get("board_size_x")
-    board_size_y = context.user_data.get("board_size_y")
-
-    if (
-        not isinstance(board_cells, dict)
-        or not isinstance(board_size_x, int)
-        or not isinstance(board_size_y, int)
-    ):
+    board = context.user_data.get("board")
+    if not isinstance(board, Board):
         logging.error("Board data missing or invalid for keyboard generation.")
         return None
 
-    # Ensure board_cells is treated as BoardCells
-    current_board_cells = cast(BoardCells, board_cells)
-
-    keyboard = []
-    # Casts are safe here due to isinstance checks
-    for y in range(1, cast(int, board_size_y) + 1):
-        row = []
-        for x in range(1, cast(int, board_size_x) + 1):
-            cell_id = f"{x}_{y}"
-            cell = current_board_cells[cell_id]  # Use the casted variable
-            if cell["revealed"] or cell["permanently_revealed"]:
-                text = cell["value"]
-            else:
-                text = "❓"
-            row.append(InlineKeyboardButton(text, callback_data=cell_id))
-        keyboard.append(row)
-    return InlineKeyboardMarkup(keyboard)
+    return render_keyboard(board)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -229,27 +178,16 @@ async def choose_dimensions(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     x_dim, y_dim = int(match.group(1)), int(match.group(2))
 
-    if x_dim > 8 or y_dim > 9 or x_dim <= 0 or y_dim <= 0:
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                "ابعاد نامعتبر است. ابعاد باید مثبت و حداکثر 8x9 باشد."
-            )
-        return CHOOSE_DIMENSIONS
-
-    if x_dim * y_dim < 2:  # Minimum 2 cells for a game
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                "ابعاد تخته خیلی کوچک است. حداقل باید ۲ خانه داشته باشد."
-            )
-        return CHOOSE_DIMENSIONS
-
-    if (
-        x_dim * y_dim > len(EMOJI_POOL) * 10
-    ):  # Check against emoji pool capacity for a reasonable game
+    problem = check_dimensions(x_dim, y_dim)
+    if problem != DIMENSIONS_OK:
+        if problem == DIMENSIONS_OUT_OF_RANGE:
+            error_message = "ابعاد نامعتبر است. ابعاد باید مثبت و حداکثر 8x9 باشد."
+        elif problem == DIMENSIONS_TOO_FEW_CELLS:
+            error_message = "ابعاد تخته خیلی کوچک است. حداقل باید ۲ خانه داشته باشد."
+        else:
+            error_message = "ابعاد تخته نسبت به تعداد شکلک‌های موجود خیلی بزرگ است. لطفاً ابعاد کوچکتری انتخاب کنید."
         if update.effective_chat:
-            await update.effective_chat.send_message(
-                "ابعاد تخته نسبت به تعداد شکلک‌های موجود خیلی بزرگ است. لطفاً ابعاد کوچکتری انتخاب کنید."
-            )
+            await update.effective_chat.send_message(error_message)
         return CHOOSE_DIMENSIONS
 
     if context.user_data is None:  # Should be initialized by PTB
@@ -308,59 +246,52 @@ async def choose_match_count(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     total_cells = board_size_x * board_size_y
 
-    if not (1 < match_count <= total_cells):
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                f"تعداد آیتم برای تطابق باید بیشتر از 1 و کمتر یا مساوی تعداد کل خانه‌ها ({total_cells}) باشد."
-            )
-        return CHOOSE_MATCH_COUNT
-
-    if total_cells % match_count != 0:
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                f"تعداد کل خانه‌ها ({total_cells}) باید بر تعداد آیتم برای تطابق ({match_count}) بخش‌پذیر باشد."
-            )
-        return CHOOSE_MATCH_COUNT
-
-    num_unique_item_sets = total_cells // match_count
-    if num_unique_item_sets <= 1 and total_cells > 1:
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                "با این تنظیمات، کمتر از دو گروه منحصر به فرد از آیتم‌ها خواهیم داشت. لطفاً تعداد تطابق را تغییر دهید یا ابعاد را بزرگتر کنید."
-            )
-        return CHOOSE_MATCH_COUNT
-
-    if num_unique_item_sets > len(EMOJI_POOL):
-        if update.effective_chat:
-            await update.effective_chat.send_message(
-                f"متاسفانه به تعداد کافی ({num_unique_item_sets}) شکلک منحصر به فرد برای این تنظیمات نداریم. "
+    problem = check_match_count(board_size_x, board_size_y, match_count)
+    if problem != MATCH_COUNT_OK:
+        if problem == MATCH_COUNT_OUT_OF_RANGE:
+            error_message = f"تعداد آیتم برای تطابق باید بیشتر از 1 و کمتر یا مساوی تعداد کل خانه‌ها ({total_cells}) باشد."
+        elif problem == MATCH_COUNT_NOT_DIVISOR:
+            error_message = f"تعداد کل خانه‌ها ({total_cells}) باید بر تعداد آیتم برای تطابق ({match_count}) بخش‌پذیر باشد."
+        elif problem == MATCH_COUNT_TOO_FEW_GROUPS:
+            error_message = "با این تنظیمات، کمتر از دو گروه منحصر به فرد از آیتم‌ها خواهیم داشت. لطفاً تعداد تطابق را تغییر دهید یا ابعاد را بزرگتر کنید."
+        else:
+            error_message = (
+                f"متاسفانه به تعداد کافی ({total_cells // match_count}) شکلک منحصر به فرد برای این تنظیمات نداریم. "
                 f"حداکثر {len(EMOJI_POOL)} گروه منحصر به فرد امکان‌پذیر است. "
                 "لطفاً ابعاد را کوچکتر یا تعداد تطابق را بیشتر کنید."
             )
+        if update.effective_chat:
+            await update.effective_chat.send_message(error_message)
         return CHOOSE_MATCH_COUNT
 
     context.user_data["match_count"] = match_count
 
-    initial_board_cells = get_initial_board_state(context)
-    if initial_board_cells is None:
+    board = get_initial_board_state(context)
+    if board is None:
         if update.effective_chat:
             await update.effective_chat.send_message(
                 "مشکلی در ساخت تخته بازی پیش آمد. لطفاً با /start مجدداً تلاش کنید."
             )
         return ConversationHandler.END
 
-    context.user_data["board_cells"] = initial_board_cells
-    context.user_data["current_selection"] = []
-    context.user_data["matched_values"] = []
-    context.user_data["game_start_time"] = time.time()  # Record game start time
+    context.user_data["board"] = board
+    GAMES_STARTED.inc(config=board.score_config_key)
 
     reply_markup = generate_keyboard(context)
 
     if update.effective_chat and reply_markup:
-        await update.effective_chat.send_message(
-            text=f"بازی شروع شد! {match_count} تا مثل هم پیدا کن!",
+        start_text = f"بازی شروع شد! {match_count} تا مثل هم پیدا کن!"
+        board_message = await update.effective_chat.send_message(
+            text=start_text,
             reply_markup=reply_markup,
         )
+        if isinstance(board_message, Message):
+            # Remembered so an abandoned game can be marked as expired
+            context.user_data["board_message"] = (
+                board_message.chat_id,
+                board_message.message_id,
+            )
+        board.rendered_fingerprint = render_fingerprint(board, start_text)
     elif update.effective_chat:
         await update.effective_chat.send_message(
             "مشکلی در نمایش تخته بازی پیش آمد. لطفاً با /start مجدداً تلاش کنید."
@@ -380,27 +311,9 @@ async def button_tap(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data is None:
         context.user_data = {}
 
-    board_cells: BoardCells | None = context.user_data.get("board_cells")
-    current_selection: list[SelectedItem] | None = context.user_data.get(
-        "current_selection"
-    )
-    matched_values: list[str] | None = context.user_data.get("matched_values")
-    match_count: int | None = context.user_data.get("match_count")
-    game_items: list[str] | None = context.user_data.get("game_items")
-    game_start_time: float | None = context.user_data.get("game_start_time")
-    board_size_x: int | None = context.user_data.get("board_size_x")  # For score key
-    board_size_y: int | None = context.user_data.get("board_size_y")  # For score key
+    board = context.user_data.get("board")
 
-    if (
-        board_cells is None
-        or current_selection is None
-        or matched_values is None
-        or match_count is None
-        or game_items is None
-        or game_start_time is None
-        or board_size_x is None
-        or board_size_y is None
-    ):
+    if not isinstance(board, Board):
         logging.warning(
             "Game state not found or incomplete in user_data in button_tap."
         )
@@ -411,7 +324,9 @@ async def button_tap(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 await query.edit_message_text(text=error_message)
             except Exception as e_edit:
-                logging.error(f"Error editing message for missing game state: {e_edit}")
+                logging.error(
+                    "Error editing message for missing game state: %s", e_edit
+                )
                 if update.effective_chat:
                     await context.bot.send_message(
                         chat_id=update.effective_chat.id, text=error_message
@@ -422,107 +337,108 @@ async def button_tap(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         return
 
-    default_message_text = f"{match_count} تا مثل هم پیدا کن!"
+    match_count = board.match_count
     cell_id = query.data
-    if cell_id is None or cell_id not in board_cells:
-        logging.warning(f"Invalid cell_id: {cell_id} from callback query.")
+    cell_index = callback_cell_index(board, cell_id)
+    if cell_index is None:
+        logging.warning("Invalid cell_id: %s from callback query.", cell_id)
         return
 
-    tapped_cell_info = board_cells[cell_id]
-
-    if tapped_cell_info["permanently_revealed"] or any(
-        sel_item["id"] == cell_id for sel_item in current_selection
-    ):
+    with segment("game"):
+        outcome = tap(board, cell_index)
+    if outcome == TAP_IGNORED:
         return
 
-    tapped_cell_info["revealed"] = True
-    current_selection.append({"id": cell_id, "value": tapped_cell_info["value"]})
-
-    message_text = default_message_text
-
-    if len(current_selection) == match_count:
-        is_match = len(set(item["value"] for item in current_selection)) == 1
-
-        if is_match:
-            matched_value = current_selection[0]["value"]
-            if matched_value not in matched_values:
-                matched_values.append(matched_value)
+    message_text = f"{match_count} تا مثل هم پیدا کن!"
 
-            for item in current_selection:
-                board_cells[item["id"]]["permanently_revealed"] = True
-                board_cells[item["id"]]["revealed"] = True
+    if outcome == TAP_WON:
+        time_taken = board.elapsed()
+        message_text = f"🎉 برنده شدی! همه رو پیدا کردی! 🎉\nزمان: {time_taken:.2f} ثانیه\nجدول امتیازات: /scores"
 
-            current_selection.clear()
+        # Store high score
+        user_name = "بازیکن"
+        if update.effective_user and update.effective_user.first_name:
+            user_name = update.effective_user.first_name
 
-            num_unique_item_types = len(set(game_items))
-            if len(matched_values) == num_unique_item_types:
-                time_taken = time.time() - game_start_time
-                message_text = f"🎉 برنده شدی! همه رو پیدا کردی! 🎉\nزمان: {time_taken:.2f} ثانیه\nجدول امتیازات: /scores"
-
-                # Store high score
-                user_name = "بازیکن"
-                if update.effective_user and update.effective_user.first_name:
-                    user_name = update.effective_user.first_name
+        leaderboard.add(board.score_config_key, user_name, time_taken)
+        GAMES_WON.inc(config=board.score_config_key)
+    elif outcome == TAP_MATCH:
+        message_text = f"✅ عالی بود! {match_count} تا {board.last_matched_value} پیدا کردی. ادامه بده!"
+    elif outcome == TAP_MISMATCH:
+        message_text = (
+            f"❌ مثل هم نبودن! ({match_count} تا باید مثل هم باشن). دوباره تلاش کن."
+        )
 
-                score_config_key = f"{board_size_x}x{board_size_y}_match{match_count}"
+    if isinstance(query.message, Message):
+        message_key = (query.message.chat_id, query.message.message_id)
+        context.user_data["board_message"] = message_key
+        await edit_scheduler.submit(
+            message_key,
+            lambda: traced_edit(update, context, board, message_text),
+        )
+    else:
+        await update_board_message(update, context, board, message_text)
 
-                if context.bot_data is None:  # Ensure bot_data is initialized
-                    context.bot_data = {}
 
-                high_scores_for_config: list = context.bot_data.get(
-                    score_config_key, []
-                )
+async def traced_edit(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    board: Board,
+    message_text: str,
+) -> None:
+    """Edits the board message, traced as a span of its own if button_tap's ended."""
+    edit = update_board_message(update, context, board, message_text)
+    if tracer is None:
+        await edit
+    else:
+        await tracer.trace("scheduled_edit", update, edit)
 
-                high_scores_for_config.append({"name": user_name, "time": time_taken})
-                high_scores_for_config.sort(
-                    key=lambda x: x["time"]
-                )  # Sort by time, ascending
-                context.bot_data[score_config_key] = high_scores_for_config[
-                    :MAX_HIGH_SCORES_PER_CONFIG
-                ]
 
-            else:
-                message_text = f"✅ عالی بود! {match_count} تا {matched_value} پیدا کردی. ادامه بده!"
-        else:
-            for item in current_selection:
-                board_cells[item["id"]]["revealed"] = False
-            current_selection.clear()
-            message_text = (
-                f"❌ مثل هم نبودن! ({match_count} تا باید مثل هم باشن). دوباره تلاش کن."
-            )
+async def update_board_message(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    board: Board,
+    message_text: str,
+) -> None:
+    """Shows the current board state and message_text in the tapped message."""
+    query = update.callback_query
+    if not query:
+        return
 
-    reply_markup = generate_keyboard(context)
-    if reply_markup is None:
-        logging.error(
-            "Failed to generate keyboard in button_tap, possibly due to missing user_data."
-        )
-        if isinstance(query.message, Message) and update.effective_chat:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="مشکلی در به‌روزرسانی تخته بازی پیش آمد.",
-            )
+    fingerprint = render_fingerprint(board, message_text)
+    if board.rendered_fingerprint == fingerprint:
+        EDIT_COUNTERS["skipped"] += 1
         return
 
+    with segment("game"):
+        reply_markup = render_keyboard(board)
+
     if isinstance(query.message, Message):
         try:
-            current_keyboard_str = (
-                str(query.message.reply_markup) if query.message.reply_markup else ""
+            await query.edit_message_text(
+                text=message_text,
+                reply_markup=reply_markup,
             )
-            new_keyboard_str = str(reply_markup)
-
-            if (
-                query.message.text != message_text
-                or current_keyboard_str != new_keyboard_str
-            ):
-                await query.edit_message_text(
-                    text=message_text,
-                    reply_markup=reply_markup,
-                )
+            board.rendered_fingerprint = fingerprint
+            EDIT_COUNTERS["sent"] += 1
+        except BadRequest as e:
+            if "not modified" in e.message.lower():
+                board.rendered_fingerprint = fingerprint
+                EDIT_COUNTERS["skipped"] += 1
+            else:
+                EDIT_COUNTERS["failed"] += 1
+                logging.error("Error editing message: %s", e)
+        except RetryAfter as e:
+            # A fallback send_message would only make the flood worse
+            EDIT_COUNTERS["failed"] += 1
+            logging.error("Error editing message: %s", e)
         except Exception as e:
-            logging.error(f"Error editing message: {e}")
+            EDIT_COUNTERS["failed"] += 1
+            logging.error("Error editing message: %s", e)
             if query.message.text != message_text and update.effective_chat:
                 logging.info(
-                    f"Falling back to sending new message for chat {update.effective_chat.id}"
+                    "Falling back to sending new message for chat %s",
+                    update.effective_chat.id,
                 )
                 try:
                     await context.bot.send_message(
@@ -530,11 +446,13 @@ async def button_tap(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         text=message_text,
                         reply_markup=reply_markup,
                     )
+                    board.rendered_fingerprint = fingerprint
                 except Exception as e_send:
-                    logging.error(f"Error sending fallback message: {e_send}")
+                    logging.error("Error sending fallback message: %s", e_send)
     elif update.effective_chat:
         logging.info(
-            f"query.message was not a usable Message instance. Sending new message to chat {update.effective_chat.id}"
+            "query.message was not a usable Message instance. Sending new message to chat %s",
+            update.effective_chat.id,
         )
         try:
             await context.bot.send_message(
@@ -542,59 +460,78 @@ async def button_tap(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text=message_text,
                 reply_markup=reply_markup,
             )
+            board.rendered_fingerprint = fingerprint
         except Exception as e_send_alt:
-            logging.error(f"Error sending new message (fallback): {e_send_alt}")
+            logging.error("Error sending new message (fallback): %s", e_send_alt)
+
+
+def parse_score_config(args: List[str]) -> str | None:
+    """Parses /scores arguments such as "4x4 2" or "4x4_match2" into a config key."""
+    match = re.fullmatch(r"(\d+)[xX×](\d+)(?:_match|\s+)(\d+)", " ".join(args))
+    if not match:
+        return None
+    return score_key(int(match.group(1)), int(match.group(2)), int(match.group(3)))
 
 
 async def show_scores(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Displays the high scores."""
+    """Displays the high scores of one configuration or the first page of all of them."""
     if not update.effective_chat:
         return
 
-    if context.bot_data is None or not context.bot_data:
+    if context.args:
+        config_key = parse_score_config(context.args)
+        if config_key is None:
+            await update.effective_chat.send_message(
+                "فرمت نامعتبر است. مثال: /scores 4x4 2"
+            )
+            return
+        response_message = leaderboard.config_text(config_key)
+        if response_message is None:
+            await update.effective_chat.send_message(
+                "برای این تنظیمات هنوز امتیازی ثبت نشده است."
+            )
+            return
+        await update.effective_chat.send_message(
+            response_message, parse_mode="Markdown"
+        )
+        return
+
+    response_message = leaderboard.page_text(0)
+    if response_message is None:
         await update.effective_chat.send_message("هنوز هیچ امتیازی ثبت نشده است.")
         return
 
-    response_message = "🏆 **جدول امتیازات برتر** 🏆\n\n"
-    found_scores = False
+    await update.effective_chat.send_message(
+        response_message,
+        parse_mode="Markdown",
+        reply_markup=scores_page_keyboard(0, leaderboard.page_count),
+    )
 
-    sorted_configs = sorted(
-        context.bot_data.keys()
-    )  # Sort for consistent display order
 
-    for config_key in sorted_configs:
-        if not isinstance(context.bot_data[config_key], list):  # Skip non-score data
-            continue
+async def show_scores_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switches a /scores message to the page chosen with its navigation buttons."""
+    query = update.callback_query
+    if not query or not query.data:
+        return
 
-        scores = context.bot_data.get(config_key, [])
-        if scores:
-            found_scores = True
-            # Format the config key for display (e.g., "3x3_match3" -> "3x3 - تطابق 3")
-            try:
-                dims, match_val_str = config_key.split("_match")
-                match_val = int(match_val_str)
-                config_display_name = f"{dims} (تطابق {match_val})"
-            except ValueError:
-                config_display_name = config_key.replace("_match", " - تطابق ")
-
-            response_message += f"🕹️ **{config_display_name}**:\n"
-            for i, score_entry in enumerate(scores):
-                if (
-                    isinstance(score_entry, dict)
-                    and "name" in score_entry
-                    and "time" in score_entry
-                ):
-                    response_message += f"  {i + 1}. {score_entry['name']}: {score_entry['time']:.2f} ثانیه\n"
-                else:
-                    logging.warning(
-                        f"Malformed score entry for {config_key}: {score_entry}"
-                    )
-            response_message += "\n"
+    await query.answer()
 
-    if not found_scores:
-        response_message = "هنوز هیچ امتیازی برای بازی‌های انجام شده ثبت نشده است."
+    page = int(query.data[len(SCORES_CALLBACK_PREFIX) :])
+    page_count = leaderboard.page_count
+    page = min(page, page_count - 1)
+    response_message = leaderboard.page_text(page)
+    if response_message is None or not isinstance(query.message, Message):
+        return
 
-    await update.effective_chat.send_message(response_message, parse_mode="Markdown")
+    try:
+        await query.edit_message_text(
+            text=response_message,
+            parse_mode="Markdown",
+            reply_markup=scores_page_keyboard(page, page_count),
+        )
+    except BadRequest as e:
+        if "not modified" not in e.message.lower():
+            logging.error("Error editing scores message: %s", e)
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -612,8 +549,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat and update.message and update.message.text:
         if not context.user_data or not any(
-            k in context.user_data
-            for k in ["board_size_x", "match_count", "board_cells"]
+            k in context.user_data for k in ["board_size_x", "match_count", "board"]
         ):
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
@@ -621,7 +557,167 @@ async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
 
-if __name__ == "__main__":
+async def save_leaderboard_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            leaderboard.save()
+        except OSError as e:
+            logging.error("Error saving leaderboard: %s", e)
+
+
+def collect_metrics(application: Application) -> List[MetricFamily]:
+    """Computes the metrics that are read from application state at scrape time."""
+    active_games = sum(
+        1
+        for user_data in application.user_data.values()
+        if isinstance(user_data.get("board"), Board) and not user_data["board"].is_won()
+    )
+    families = [
+        gauge_family(
+            "matchbot_active_games", "Unfinished games in memory.", active_games
+        ),
+        counter_family(
+            "matchbot_board_edits_total",
+            "Board message edits by outcome.",
+            EDIT_COUNTERS,
+            "outcome",
+        ),
+        counter_family(
+            "matchbot_board_edits_coalesced_total",
+            "Board edits replaced by a later tap before being sent.",
+            {"scheduler": edit_scheduler.coalesced},
+            "source",
+        ),
+        counter_family(
+            "matchbot_board_pool_total",
+            "Game starts served from the board pool (hits) or not (misses), "
+            "and boards generated for the pool.",
+            board_pool.stats,
+            "result",
+        ),
+        gauge_family(
+            "matchbot_board_pool_boards", "Boards ready in the pool.", len(board_pool)
+        ),
+    ]
+    if isinstance(application.persistence, SQLitePersistence):
+        stats = application.persistence.flush_stats
+        families += [
+            counter_family(
+                "matchbot_persistence_rows_total",
+                "Persistence rows by outcome.",
+                {"written": stats["rows_written"], "skipped": stats["rows_skipped"]},
+                "outcome",
+            ),
+            counter_family(
+                "matchbot_persistence_flushes_total",
+                "Persistence write batches.",
+                {"sqlite": stats["flushes"]},
+                "backend",
+            ),
+            counter_family(
+                "matchbot_persistence_flush_seconds_total",
+                "Time spent writing persistence batches.",
+                {"sqlite": stats["total_flush_seconds"]},
+                "backend",
+            ),
+            gauge_family(
+                "matchbot_persistence_last_batch_size",
+                "Rows in the last persistence batch.",
+                stats["last_batch_size"],
+            ),
+        ]
+        if application.persistence.lazy_user_data:
+            families.append(
+                counter_family(
+                    "matchbot_user_data_cache_total",
+                    "Lazily loaded user_data: hits, loads and page outs.",
+                    application.persistence.cache_stats,
+                    "event",
+                )
+            )
+    rate_limiter = getattr(application.bot, "rate_limiter", None)
+    if isinstance(rate_limiter, TracingRateLimiter):
+        rate_limiter = rate_limiter.inner
+    if isinstance(rate_limiter, TokenBucketRateLimiter):
+        families.append(
+            counter_family(
+                "matchbot_rate_limiter_events_total",
+                "Outgoing requests, requests delayed by a bucket and flood waits.",
+                rate_limiter.stats,
+                "event",
+            )
+        )
+    return families
+
+
+async def post_init(application: Application) -> None:
+    """Loads the leaderboard and starts the background tasks and metrics server."""
+    startup_marks["initialized"] = time.perf_counter()
+    if not leaderboard.load():
+        # First run with a separate leaderboard: move legacy tables out of bot_data
+        legacy_keys = [
+            key
+            for key, value in application.bot_data.items()
+            if isinstance(value, list)
+        ]
+        leaderboard.update_from({key: application.bot_data[key] for key in legacy_keys})
+        for key in legacy_keys:
+            del application.bot_data[key]
+        leaderboard.dirty = True
+        leaderboard.save()
+
+    interval = (
+        application.persistence.update_interval if application.persistence else 60
+    )
+    background_tasks.add(asyncio.create_task(save_leaderboard_periodically(interval)))
+    if game_expiry is not None:
+        background_tasks.add(
+            asyncio.create_task(
+                game_expiry.run(application, GAME_EXPIRY_SWEEP_INTERVAL)
+            )
+        )
+
+    if metrics_address is not None:
+        metrics_servers.append(await start_metrics_server(*metrics_address))
+
+    if startup_report:
+        background_tasks.add(asyncio.create_task(report_startup(application)))
+
+
+async def report_startup(application: Application) -> None:
+    """Logs how long each startup phase took once updates are accepted."""
+    while not application.running:
+        await asyncio.sleep(0.005)
+    startup_marks["accepting"] = time.perf_counter()
+    phases = list(startup_marks.items())
+    durations = ", ".join(
+        f"{name} +{(mark - previous) * 1000:.0f}ms"
+        for (_, previous), (name, mark) in zip(phases, phases[1:])
+    )
+    logging.info(
+        "Accepting updates %.0fms after startup: %s",
+        (startup_marks["accepting"] - startup_marks["started"]) * 1000,
+        durations,
+    )
+
+
+async def post_stop(application: Application) -> None:
+    await edit_scheduler.flush()
+
+
+async def post_shutdown(application: Application) -> None:
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    for server in metrics_servers:
+        server.close()
+    metrics_servers.clear()
+    await board_pool.close()
+    leaderboard.save()
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Run the Telegram bot.")
     parser.add_argument(
         "--token",
@@ -675,36 +771,264 @@ if __name__ == "__main__":
         help="The URL your webhook will be served from. Replace YOUR_WEBHOOK_URL.",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--persistence",
+        type=str,
+        choices=["pickle", "sqlite"],
+        default="pickle",
+        help="Persistence backend for user and score data. Default is pickle.",
+    )
+    parser.add_argument(
+        "--persistence-file",
+        type=str,
+        required=False,
+        help="Path of the persistence file. Default is bot_data.pickle or bot_data.sqlite3.",
+    )
+
+    parser.add_argument(
+        "--persistence-interval",
+        type=float,
+        default=60,
+        help="Seconds between two persistence flushes. Default is 60.",
+    )
+    parser.add_argument(
+        "--persistence-batch-size",
+        type=int,
+        default=500,
+        help="Maximum rows written per SQLite transaction. Default is 500.",
+    )
+
+    parser.add_argument(
+        "--lazy-user-data",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Load each user's data on their first update instead of all at "
+        "startup, and page out the least recently active users. SQLite only.",
+    )
+    parser.add_argument(
+        "--max-resident-users",
+        type=int,
+        default=10000,
+        help="Users kept in memory with --lazy-user-data. Default is 10000.",
+    )
 
-    persistence = PicklePersistence(filepath="bot_data.pickle")
+    parser.add_argument(
+        "--leaderboard-file",
+        type=str,
+        default="leaderboard.json",
+        help="Path of the high score file. Default is leaderboard.json.",
+    )
 
-    application = (
-        ApplicationBuilder()
-        .token(args.token)  # Use token from args
-        .persistence(persistence)
-        .build()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of updates processed concurrently; updates of the same user "
+        "are always processed in order. Default is 1 (sequential).",
     )
 
+    parser.add_argument(
+        "--edit-delay",
+        type=float,
+        default=0.3,
+        help="Seconds after a board edit during which further taps on the same "
+        "message are coalesced into one edit, 0 edits on every tap. Default is 0.3.",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Throttle outgoing requests to Telegram's flood limits and retry "
+        "after flood waits. Enabled by default.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        help="Serve Prometheus metrics on this port. Disabled by default.",
+    )
+    parser.add_argument(
+        "--metrics-listen",
+        type=str,
+        default="127.0.0.1",
+        help="Listen address for the metrics endpoint. Default is 127.0.0.1.",
+    )
+    parser.add_argument(
+        "--slow-update-threshold",
+        type=float,
+        required=False,
+        help="Trace every update and log the ones taking at least this many "
+        "seconds with a breakdown of where the time went. Disabled by default.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        required=False,
+        help="Directory to write cProfile stats of sampled slow updates to. "
+        "Requires --slow-update-threshold.",
+    )
+    parser.add_argument(
+        "--profile-sample-rate",
+        type=float,
+        default=0.05,
+        help="Share of updates run under the profiler when --profile-dir is set. "
+        "Default is 0.05.",
+    )
+    parser.add_argument(
+        "--board-pool-size",
+        type=int,
+        default=16,
+        help="Pre-shuffled boards kept ready for each of the most requested "
+        "configs, 0 disables the pool. Default is 16.",
+    )
+    parser.add_argument(
+        "--game-ttl",
+        type=float,
+        default=24 * 60 * 60,
+        help="Seconds after the last tap when a game expires and its state is "
+        "freed, 0 keeps games forever. Default is 86400 (one day).",
+    )
+    parser.add_argument(
+        "--expiry-batch-size",
+        type=int,
+        default=20,
+        help="Expiry notices sent per second when expiring games. Default is 20.",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="Log how long imports, building, initializing (getMe and loading "
+        "persistence) and starting took until updates were accepted.",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Default is INFO.",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["json", "text"],
+        default="json",
+        help="json writes one JSON object per line. Default is json.",
+    )
+    return parser
+
+
+def build_application(
+    args: argparse.Namespace, builder: ApplicationBuilder | None = None
+) -> Application:
+    """Builds the Application with all handlers from parsed command line arguments."""
+    global metrics_address, game_expiry, tracer, startup_report
+    startup_report = args.startup_report
+    leaderboard.filepath = args.leaderboard_file
+    edit_scheduler.delay = args.edit_delay
+    board_pool.size = args.board_pool_size
+    if args.metrics_port is not None:
+        metrics_address = (args.metrics_listen, args.metrics_port)
+    if args.game_ttl > 0:
+        game_expiry = GameExpiry(args.game_ttl, args.expiry_batch_size)
+
+    persistence: BasePersistence
+    if args.persistence == "sqlite":
+        persistence = SQLitePersistence(
+            filepath=args.persistence_file or "bot_data.sqlite3",
+            update_interval=args.persistence_interval,
+            max_batch_size=args.persistence_batch_size,
+            lazy_user_data=args.lazy_user_data,
+            max_resident_users=args.max_resident_users,
+        )
+    elif args.lazy_user_data:
+        raise ValueError("--lazy-user-data requires --persistence sqlite")
+    else:
+        persistence = PicklePersistence(
+            filepath=args.persistence_file or "bot_data.pickle",
+            update_interval=args.persistence_interval,
+        )
+
+    if builder is None:
+        builder = ApplicationBuilder().token(args.token)  # Use token from args
+    builder = (
+        builder.persistence(persistence)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    tracer = None
+    if args.slow_update_threshold is not None:
+        tracer = Tracer(
+            args.slow_update_threshold, args.profile_dir, args.profile_sample_rate
+        )
+    rate_limiter = TokenBucketRateLimiter() if args.rate_limit else None
+    if tracer is not None:
+        rate_limiter = TracingRateLimiter(rate_limiter)
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    update_processor: BaseUpdateProcessor | None = None
+    if args.workers > 1:
+        update_processor = PerUserUpdateProcessor(args.workers)
+    if tracer is not None:
+        update_processor = TracingUpdateProcessor(
+            tracer, update_processor or SimpleUpdateProcessor(1)
+        )
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    application = builder.build()
+
+    def instrument(name: str, callback: Callable) -> Callable:
+        callback = timed(name, callback)
+        return tracer.wrap(name, callback) if tracer is not None else callback
+
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[CommandHandler("start", instrument("start", start))],
         states={
             CHOOSE_DIMENSIONS: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, choose_dimensions)
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    instrument("choose_dimensions", choose_dimensions),
+                )
             ],
             CHOOSE_MATCH_COUNT: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, choose_match_count)
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    instrument("choose_match_count", choose_match_count),
+                )
             ],
         },
-        fallbacks=[CommandHandler("start", start), CommandHandler("cancel", cancel)],
+        fallbacks=[
+            CommandHandler("start", instrument("start", start)),
+            CommandHandler("cancel", instrument("cancel", cancel)),
+        ],
     )
 
     application.add_handler(conv_handler)
-    application.add_handler(CallbackQueryHandler(button_tap))
     application.add_handler(
-        CommandHandler("scores", show_scores)
+        CallbackQueryHandler(
+            instrument("show_scores_page", show_scores_page),
+            pattern=rf"^{SCORES_CALLBACK_PREFIX}\d+$",
+        )
+    )
+    application.add_handler(CallbackQueryHandler(instrument("button_tap", button_tap)))
+    application.add_handler(
+        CommandHandler("scores", instrument("show_scores", show_scores))
     )  # Add /scores command handler
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_message))
+    application.add_handler(
+        MessageHandler(
+            filters.TEXT & ~filters.COMMAND, instrument("on_message", on_message)
+        )
+    )
+    REGISTRY.add_collector(lambda: collect_metrics(application))
+
+    startup_marks["built"] = time.perf_counter()
+    return application
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    atexit.register(setup_logging(args.log_level, args.log_format).stop)
+    application = build_application(args)
 
     if args.mode == "webhook":
         if (
@@ -717,7 +1041,10 @@ if __name__ == "__main__":
             )
             exit(1)
         logging.info(
-            f"Starting bot in webhook mode. URL: {args.webhook_url}, Port: {args.port}, Listen: {args.listen}"
+            "Starting bot in webhook mode. URL: %s, Port: %s, Listen: %s",
+            args.webhook_url,
+            args.port,
+            args.listen,
         )
         application.run_webhook(
             listen=args.listen,
@@ -0,0 +1,265 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+# Default histogram buckets in seconds, from sub-millisecond engine work up
+# to multi-second Bot API round trips
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+LabelValues = Tuple[str, ...]
+# (metric name, type, help, [(sample suffix, labels, value), ...])
+MetricFamily = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Metric:
+    metric_type = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def collect(self) -> MetricFamily:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> MetricFamily:
+        samples = [
+            ("", self._labels(key), value) for key, value in self._values.items()
+        ]
+        return self.name, self.metric_type, self.documentation, samples
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (non-cumulative, last one is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+
+    def collect(self) -> MetricFamily:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append(("_bucket", {**labels, "le": le}, cumulative))
+            samples.append(("_count", labels, cumulative))
+            samples.append(("_sum", labels, total[0]))
+        return self.name, self.metric_type, self.documentation, samples
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders the text format."""
+
+    def __init__(self) -> None:
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """Adds a function returning metric families computed at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logging.error("Error collecting metrics: %s", e)
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS: Histogram = REGISTRY.register(
+    Histogram("matchbot_handler_seconds", "Time spent in update handlers.", ["handler"])
+)
+HANDLER_ERRORS: Counter = REGISTRY.register(
+    Counter(
+        "matchbot_handler_errors_total", "Exceptions raised by handlers.", ["handler"]
+    )
+)
+GAMES_STARTED: Counter = REGISTRY.register(
+    Counter("matchbot_games_started_total", "Games started.", ["config"])
+)
+GAMES_WON: Counter = REGISTRY.register(
+    Counter("matchbot_games_won_total", "Games won.", ["config"])
+)
+GAMES_EXPIRED: Counter = REGISTRY.register(
+    Counter(
+        "matchbot_games_expired_total",
+        "Unfinished games expired when idle.",
+        ["config"],
+    )
+)
+
+
+def counter_family(
+    name: str, documentation: str, values: Dict[str, float], label: str
+) -> MetricFamily:
+    """Builds a counter family from a {label value: count} mapping."""
+    samples = [("", {label: key}, float(value)) for key, value in values.items()]
+    return name, "counter", documentation, samples
+
+
+def gauge_family(name: str, documentation: str, value: float) -> MetricFamily:
+    return name, "gauge", documentation, [("", {}, float(value))]
+
+
+def timed(name: str, callback: F) -> F:
+    """Wraps a handler callback to record its duration in HANDLER_SECONDS."""
+
+    @functools.wraps(callback)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+    return wrapper  # type: ignore[return-value]
+
+
+async def _handle_request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request_line = await reader.readline()
+        # Drain the headers, the request body is never used
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if (
+            len(parts) >= 2
+            and parts[0] == "GET"
+            and parts[1].split("?")[0] == "/metrics"
+        ):
+            status = "200 OK"
+            body = REGISTRY.render().encode()
+        else:
+            status = "404 Not Found"
+            body = b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Serves REGISTRY at http://host:port/metrics on the running event loop."""
+    server = await asyncio.start_server(_handle_request, host, port)
+    logging.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,416 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import time
+import weakref
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple, TypeVar
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._utils.types import ConversationDict, ConversationKey
+
+from tracing import segment
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bot_data (key TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS callback_data (id INTEGER PRIMARY KEY CHECK (id = 0), data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+# Key columns of every table, in the order rows are keyed in _pending
+KEY_COLUMNS = {
+    "user_data": ("user_id",),
+    "chat_data": ("chat_id",),
+    "bot_data": ("key",),
+    "callback_data": ("id",),
+    "conversations": ("name", "key"),
+}
+
+RowId = Tuple[str, Tuple]
+
+
+def _dumps(obj: object) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _upsert_sql(table: str) -> str:
+    columns = KEY_COLUMNS[table] + ("data",)
+    placeholders = ", ".join("?" for _ in columns)
+    return (
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    )
+
+
+def _delete_sql(table: str) -> str:
+    condition = " AND ".join(f"{column} = ?" for column in KEY_COLUMNS[table])
+    return f"DELETE FROM {table} WHERE {condition}"
+
+
+class SQLitePersistence(
+    BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]
+):
+    """Persistence backed by a SQLite database in WAL mode.
+
+    Every user, chat and top level bot_data key (i.e. each high score
+    configuration) is its own row. Updates handed over by the Application are
+    only queued: rows whose serialized form did not change since the last
+    write are dropped, repeated updates of the same row coalesce, and the
+    queue is written in transactions of at most max_batch_size rows on a
+    single dedicated thread, keeping the event loop free.
+
+    With lazy_user_data, no user_data is loaded at startup. A user's row is
+    read when PTB refreshes their user_data before handling one of their
+    updates, and once more than max_resident_users are in memory, the least
+    recently used ones are queued for writing and emptied. Only their empty
+    dicts stay in the Application, so memory follows the active users. Users
+    whose update is still being processed are never paged out, so the cap
+    can be exceeded by the number of updates in flight.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        max_batch_size: int = 500,
+        lazy_user_data: bool = False,
+        max_resident_users: int = 10000,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self.max_batch_size = max_batch_size
+        self._connection: sqlite3.Connection | None = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite-persistence"
+        )
+        # Rows waiting to be written; None marks a deletion
+        self._pending: Dict[RowId, bytes | None] = {}
+        # hash() of the last written blob of every row, used to skip unchanged rows
+        self._digests: Dict[RowId, int] = {}
+        # Rows of the batch being written, whose digests are not up to date yet
+        self._writing: Set[RowId] = set()
+        # Keys of the bot_data rows stored or queued, to find deleted keys
+        self._bot_data_keys: Set[Tuple] = set()
+        self._write_task: asyncio.Task | None = None
+        self.lazy_user_data = lazy_user_data
+        self.max_resident_users = max_resident_users
+        # Live user_data dicts loaded in lazy mode, least recently used first
+        self._resident: OrderedDict[int, Dict[Any, Any]] = OrderedDict()
+        # Task processing the last update of every resident user, held weakly so
+        # that finished tasks are freed
+        self._user_tasks: Dict[int, weakref.ref] = {}
+        # Last user_id visited by update_paged_out_user_data
+        self._paged_out_cursor: int | None = None
+        self.cache_stats: Counter = Counter()
+        self.flush_stats: Dict[str, float] = {
+            "flushes": 0,
+            "rows_written": 0,
+            "rows_skipped": 0,
+            "last_batch_size": 0,
+            "last_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.filepath)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        with segment("persistence"):
+            return await loop.run_in_executor(
+                self._executor, lambda: func(self._connect())
+            )
+
+    def _remember(self, table: str, rows: Iterable[Tuple]) -> None:
+        """Records the digests of rows just loaded from table."""
+        for *key, data in rows:
+            self._digests[(table, tuple(key))] = hash(data)
+
+    def _enqueue(self, table: str, key: Tuple, blob: bytes | None) -> None:
+        row_id = (table, key)
+        if (
+            blob is not None
+            and row_id not in self._writing
+            and self._digests.get(row_id) == hash(blob)
+        ):
+            # Back to what is already stored, drop any newer pending write
+            self._pending.pop(row_id, None)
+            self.flush_stats["rows_skipped"] += 1
+            return
+        self._pending[row_id] = blob
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        # Let the rest of the current persistence run enqueue its rows first
+        await asyncio.sleep(0)
+        while self._pending:
+            batch = []
+            for row_id in list(self._pending)[: self.max_batch_size]:
+                batch.append((row_id, self._pending.pop(row_id)))
+            self._writing = {row_id for row_id, _ in batch}
+            started = time.perf_counter()
+            try:
+                await self._run(lambda connection: self._write_batch(connection, batch))
+            except Exception as e:
+                self._writing = set()
+                logging.error(
+                    "Error writing %s rows to %s: %s", len(batch), self.filepath, e
+                )
+                # Keep the rows for the next run unless they were superseded meanwhile
+                for row_id, blob in batch:
+                    self._pending.setdefault(row_id, blob)
+                return
+            duration = time.perf_counter() - started
+            self._writing = set()
+
+            for row_id, blob in batch:
+                # Deletions keep hash(None), so stale copies read earlier never match
+                self._digests[row_id] = hash(blob)
+            stats = self.flush_stats
+            stats["flushes"] += 1
+            stats["rows_written"] += len(batch)
+            stats["last_batch_size"] = len(batch)
+            stats["last_flush_seconds"] = duration
+            stats["total_flush_seconds"] += duration
+            logging.debug("Persisted %s rows in %.3fs", len(batch), duration)
+
+    @staticmethod
+    def _write_batch(
+        connection: sqlite3.Connection, batch: List[Tuple[RowId, bytes | None]]
+    ) -> None:
+        with connection:
+            for (table, key), blob in batch:
+                if blob is None:
+                    connection.execute(_delete_sql(table), key)
+                else:
+                    connection.execute(_upsert_sql(table), key + (blob,))
+
+    async def _load_rows(self, sql: str) -> list:
+        return await self._run(lambda connection: connection.execute(sql).fetchall())
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        if self.lazy_user_data:
+            return {}
+        rows = await self._load_rows("SELECT user_id, data FROM user_data")
+        self._remember("user_data", rows)
+        return {user_id: pickle.loads(data) for user_id, data in rows}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self._load_rows("SELECT chat_id, data FROM chat_data")
+        self._remember("chat_data", rows)
+        return {chat_id: pickle.loads(data) for chat_id, data in rows}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        rows = await self._load_rows("SELECT key, data FROM bot_data")
+        self._remember("bot_data", rows)
+        self._bot_data_keys = {(key,) for key, _ in rows}
+        return {key: pickle.loads(data) for key, data in rows}
+
+    async def get_callback_data(self) -> Any:
+        rows = await self._load_rows("SELECT id, data FROM callback_data")
+        self._remember("callback_data", rows)
+        return pickle.loads(rows[0][1]) if rows else None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        def load(connection: sqlite3.Connection) -> list:
+            return connection.execute(
+                "SELECT name, key, data FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+
+        rows = await self._run(load)
+        self._remember("conversations", rows)
+        return {tuple(json.loads(key)): pickle.loads(data) for _, key, data in rows}
+
+    async def update_conversation(
+        self, name: str, key: ConversationKey, new_state: object | None
+    ) -> None:
+        blob = None if new_state is None else _dumps(new_state)
+        self._enqueue("conversations", (name, json.dumps(list(key))), blob)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        if self.lazy_user_data and user_id not in self._resident:
+            # Paged out after being marked for update, its data is already queued
+            return
+        self._enqueue("user_data", (user_id,), _dumps(data))
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._enqueue("chat_data", (chat_id,), _dumps(data))
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        keys = set()
+        for key, value in data.items():
+            keys.add((str(key),))
+            self._enqueue("bot_data", (str(key),), _dumps(value))
+        for key in self._bot_data_keys - keys:
+            self._enqueue("bot_data", key, None)
+        self._bot_data_keys = keys
+
+    async def update_callback_data(self, data: Any) -> None:
+        self._enqueue("callback_data", (0,), _dumps(data))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._enqueue("chat_data", (chat_id,), None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._resident.pop(user_id, None)
+        self._user_tasks.pop(user_id, None)
+        self._enqueue("user_data", (user_id,), None)
+
+    async def _load_user_row(self, user_id: int) -> bytes | None:
+        row_id = ("user_data", (user_id,))
+        if row_id in self._pending:
+            return self._pending[row_id]
+        rows = await self._run(
+            lambda connection: connection.execute(
+                "SELECT data FROM user_data WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        )
+        if not rows:
+            return None
+        self._digests[row_id] = hash(rows[0][0])
+        return rows[0][0]
+
+    def _in_flight(self, user_id: int, current: asyncio.Task | None) -> bool:
+        """Tells whether an update of user_id other than the current one is running.
+
+        Without concurrent updates, every update runs in the same task and the
+        previous one is finished whenever another user is refreshed.
+        """
+        ref = self._user_tasks.get(user_id)
+        task = ref() if ref is not None else None
+        return task is not None and task is not current and not task.done()
+
+    def _track_task(self, user_id: int) -> None:
+        task = asyncio.current_task()
+        if task is None:
+            self._user_tasks.pop(user_id, None)
+        else:
+            self._user_tasks[user_id] = weakref.ref(task)
+
+    def _page_out_idle_users(self, refreshed_user_id: int) -> None:
+        excess = len(self._resident) - self.max_resident_users
+        if excess <= 0:
+            return
+        current = asyncio.current_task()
+        idle = []
+        for user_id in self._resident:
+            if len(idle) == excess:
+                break
+            if user_id == refreshed_user_id:
+                continue
+            if self._in_flight(user_id, current):
+                self.cache_stats["page_outs_deferred"] += 1
+            else:
+                idle.append(user_id)
+        for user_id in idle:
+            user_data = self._resident.pop(user_id)
+            self._user_tasks.pop(user_id, None)
+            self._enqueue("user_data", (user_id,), _dumps(user_data))
+            user_data.clear()
+            self.cache_stats["page_outs"] += 1
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        """Loads user_data from the database on first access in lazy mode."""
+        if not self.lazy_user_data:
+            return
+        self._track_task(user_id)
+        if user_id in self._resident:
+            self._resident.move_to_end(user_id)
+            self.cache_stats["hits"] += 1
+            return
+
+        blob = await self._load_user_row(user_id)
+        # Again, a concurrent update may have dropped the user meanwhile
+        self._track_task(user_id)
+        if user_id in self._resident:  # loaded by a concurrent update meanwhile
+            return
+        if blob is not None:
+            user_data.update(pickle.loads(blob))
+        self._resident[user_id] = user_data
+        self.cache_stats["loads"] += 1
+        self._page_out_idle_users(user_id)
+
+    async def update_paged_out_user_data(
+        self, update: Callable[[int, Dict[Any, Any]], bool], max_rows: int
+    ) -> int:
+        """Applies update to the stored user_data of users not in memory.
+
+        Meant for maintenance such as expiring idle games in lazy mode, where
+        most users only exist in the database. update(user_id, data) changes
+        data in place and returns True if it did. At most max_rows rows are
+        visited per call, continuing where the previous call stopped and
+        starting over after the last row. Rows of users loaded or written
+        meanwhile are skipped. Returns the number of rows changed.
+        """
+        if not self.lazy_user_data:
+            return 0
+        changed = 0
+        visited = 0
+        while visited < max_rows:
+            after = self._paged_out_cursor
+            limit = min(self.max_batch_size, max_rows - visited)
+            rows = await self._run(
+                lambda connection: connection.execute(
+                    "SELECT user_id, data FROM user_data "
+                    "WHERE ? IS NULL OR user_id > ? ORDER BY user_id LIMIT ?",
+                    (after, after, limit),
+                ).fetchall()
+            )
+            if not rows:
+                self._paged_out_cursor = None
+                break
+            visited += len(rows)
+            self._paged_out_cursor = rows[-1][0]
+            for user_id, blob in rows:
+                row_id = ("user_data", (user_id,))
+                digest = self._digests.get(row_id)
+                if (
+                    user_id in self._resident
+                    or row_id in self._pending
+                    or (digest is not None and digest != hash(blob))
+                ):
+                    continue
+                data = pickle.loads(blob)
+                if update(user_id, data):
+                    self._enqueue("user_data", (user_id,), _dumps(data))
+                    changed += 1
+        return changed
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        """Does nothing."""
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """Does nothing."""
+
+    async def flush(self) -> None:
+        """Writes all queued rows, checkpoints the WAL and closes the database."""
+
+        def close(connection: sqlite3.Connection) -> None:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.close()
+
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+        if self._connection is not None:
+            await self._run(close)
+            self._connection = None
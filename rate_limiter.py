@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Callable, Coroutine, Dict
+
+from telegram import constants
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Endpoints that are answered right away instead of waiting for a token
+PRIORITY_ENDPOINTS = frozenset({"answerCallbackQuery"})
+
+MAX_IDLE_CHAT_BUCKETS = 1024
+
+
+class TokenBucket:
+    """Token bucket handing out reservations.
+
+    reserve() always takes a token, letting the balance go negative, and
+    returns how long the caller has to wait for it. Callers therefore queue up
+    in the order they asked without any locking.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class TokenBucketRateLimiter(BaseRateLimiter[int]):
+    """Keeps outgoing Bot API calls under Telegram's flood limits.
+
+    Requests with a chat_id take a token from a per-chat bucket, from a
+    per-group bucket for group chats and from the global bucket. Callback
+    query answers skip the buckets so they are never stuck behind edits. On
+    RetryAfter all requests pause for the requested time and the failed one is
+    retried up to max_retries times (or rate_limit_args, if given).
+    """
+
+    def __init__(
+        self,
+        overall_rate: float = constants.FloodLimit.MESSAGES_PER_SECOND,
+        chat_rate: float = constants.FloodLimit.MESSAGES_PER_SECOND_PER_CHAT,
+        chat_burst: float = 3,
+        group_rate: float = constants.FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP / 60,
+        max_retries: int = 3,
+    ) -> None:
+        self.overall_bucket = TokenBucket(overall_rate, overall_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.stats: Counter = Counter()
+        self._chat_buckets: Dict[int | str, TokenBucket] = {}
+        self._group_buckets: Dict[int | str, TokenBucket] = {}
+        self._paused_until = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _bucket(
+        self,
+        buckets: Dict[int | str, TokenBucket],
+        key: int | str,
+        rate: float,
+        burst: float,
+    ) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                # Full buckets carry no state, so they can be dropped safely
+                for idle_key in [k for k, b in buckets.items() if b.is_full()]:
+                    del buckets[idle_key]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _wait_for_tokens(self, endpoint: str, chat_id: Any) -> None:
+        if endpoint in PRIORITY_ENDPOINTS or chat_id is None:
+            return
+        try:
+            chat_id = int(chat_id)
+        except (ValueError, TypeError):
+            pass
+
+        delay = self._bucket(
+            self._chat_buckets, chat_id, self.chat_rate, self.chat_burst
+        ).reserve()
+        if isinstance(chat_id, str) or chat_id < 0:
+            # string chat_id only works for channels and supergroups
+            delay = max(
+                delay,
+                self._bucket(
+                    self._group_buckets, chat_id, self.group_rate, 1
+                ).reserve(),
+            )
+        delay = max(delay, self.overall_bucket.reserve())
+        if delay > 0:
+            self.stats["delayed"] += 1
+            await asyncio.sleep(delay)
+
+    async def _wait_for_pause(self) -> None:
+        while (remaining := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> Any:
+        max_retries = (
+            rate_limit_args if rate_limit_args is not None else self.max_retries
+        )
+        self.stats["requests"] += 1
+        await self._wait_for_tokens(endpoint, data.get("chat_id"))
+
+        attempt = 0
+        while True:
+            await self._wait_for_pause()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.stats["retry_after"] += 1
+                if attempt == max_retries:
+                    logging.error(
+                        "Rate limit hit on %s after %s retries", endpoint, max_retries
+                    )
+                    raise
+                attempt += 1
+                retry_after = e.retry_after
+                seconds = (
+                    retry_after
+                    if isinstance(retry_after, (int, float))
+                    else retry_after.total_seconds()
+                )
+                logging.info("Rate limit hit on %s, pausing for %ss", endpoint, seconds)
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + seconds + 0.1
+                )
@@ -0,0 +1,234 @@
+import importlib.util
+import pickle
+import random
+import unittest
+import zlib
+from typing import List
+from unittest import mock
+
+import board
+from board import (
+    HIDDEN_CELL_TEXT,
+    TAP_IGNORED,
+    TAP_MATCH,
+    TAP_MISMATCH,
+    TAP_SELECTED,
+    TAP_WON,
+    Board,
+)
+
+
+def play(game: Board, taps: List[int]) -> List[int]:
+    return [game.tap(index) for index in taps]
+
+
+class ReferenceGame:
+    """The rules as the handlers implemented them with a dict per cell."""
+
+    def __init__(self, items: List[int], match_count: int) -> None:
+        self.cells = [
+            {"value": item, "revealed": False, "permanent": False} for item in items
+        ]
+        self.match_count = match_count
+        self.selection: List[int] = []
+
+    def tap(self, index: int) -> int:
+        cell = self.cells[index]
+        if cell["permanent"] or index in self.selection:
+            return TAP_IGNORED
+        cell["revealed"] = True
+        self.selection.append(index)
+        if len(self.selection) < self.match_count:
+            return TAP_SELECTED
+        selection, self.selection = self.selection, []
+        if len({self.cells[i]["value"] for i in selection}) > 1:
+            for i in selection:
+                self.cells[i]["revealed"] = False
+            return TAP_MISMATCH
+        for i in selection:
+            self.cells[i]["permanent"] = True
+        if all(cell["permanent"] for cell in self.cells):
+            return TAP_WON
+        return TAP_MATCH
+
+    def visible(self) -> List[bool]:
+        return [cell["revealed"] or cell["permanent"] for cell in self.cells]
+
+
+class TapTest(unittest.TestCase):
+    def setUp(self) -> None:
+        # 0 1
+        # 1 0
+        self.game = Board(2, 2, 2, bytearray([0, 1, 1, 0]), 0.0)
+
+    def test_mismatch_hides_the_selection_again(self) -> None:
+        self.assertEqual(play(self.game, [0, 1]), [TAP_SELECTED, TAP_MISMATCH])
+        self.assertEqual(self.game.cell_text(0), HIDDEN_CELL_TEXT)
+        self.assertEqual(self.game.cell_text(1), HIDDEN_CELL_TEXT)
+        self.assertEqual(self.game.selection, [])
+
+    def test_matches_stay_revealed_until_won(self) -> None:
+        self.assertEqual(play(self.game, [0, 3]), [TAP_SELECTED, TAP_MATCH])
+        self.assertEqual(self.game.cell_text(0), self.game.pool[0])
+        self.assertEqual(self.game.last_matched_value, self.game.pool[0])
+        self.assertFalse(self.game.is_won())
+        self.assertEqual(play(self.game, [1, 2]), [TAP_SELECTED, TAP_WON])
+        self.assertTrue(self.game.is_won())
+
+    def test_revealed_and_selected_cells_are_ignored(self) -> None:
+        self.assertEqual(play(self.game, [0, 0]), [TAP_SELECTED, TAP_IGNORED])
+        play(self.game, [3])
+        self.assertEqual(play(self.game, [0, 3]), [TAP_IGNORED, TAP_IGNORED])
+
+    def test_random_games_follow_the_reference_rules(self) -> None:
+        rng = random.Random(0)
+        for config in [(2, 2, 2), (3, 4, 2), (4, 4, 4), (6, 6, 3), (8, 9, 2)]:
+            for _ in range(20):
+                game = Board.new(*config, seed=rng.getrandbits(64))
+                assert game is not None
+                reference = ReferenceGame(list(game.items), game.match_count)
+                for _ in range(game.cell_count * 6):
+                    index = rng.randrange(game.cell_count)
+                    self.assertEqual(game.tap(index), reference.tap(index))
+                    self.assertEqual(
+                        [game.is_visible(i) for i in range(game.cell_count)],
+                        reference.visible(),
+                    )
+                    self.assertEqual(game.selection, reference.selection)
+                    self.assertEqual(
+                        game.is_won(), all(reference.visible()) and not game.selection
+                    )
+
+    def test_layout_holds_every_item_match_count_times(self) -> None:
+        game = Board.new(6, 6, 3)
+        assert game is not None
+        self.assertEqual(game.cell_count, 36)
+        self.assertEqual(
+            sorted(game.items), sorted(list(range(game.unique_item_count)) * 3)
+        )
+
+    def test_same_seed_gives_same_layout(self) -> None:
+        self.assertEqual(
+            Board.new(6, 6, 3, seed=42).items, Board.new(6, 6, 3, seed=42).items
+        )
+
+    def test_invalid_config(self) -> None:
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(Board.new(3, 3, 2))
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "NumPy is not installed")
+class BatchTest(unittest.TestCase):
+    def test_batch_holds_shuffled_layouts(self) -> None:
+        batch = board.generate_item_indices_batch(50, 6, 4, 3, seed=1)
+        assert batch is not None
+        self.assertEqual(batch.shape, (50, 4, 6))
+        for row in batch.reshape(50, -1):
+            self.assertEqual(sorted(row.tolist()), sorted(list(range(8)) * 3))
+
+    def test_same_seed_gives_same_batch(self) -> None:
+        first = board.generate_item_indices_batch(20, 4, 4, 2, seed=42)
+        second = board.generate_item_indices_batch(20, 4, 4, 2, seed=42)
+        assert first is not None and second is not None
+        self.assertEqual(first.tolist(), second.tolist())
+
+    def test_invalid_config(self) -> None:
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(board.generate_item_indices_batch(10, 3, 3, 2))
+
+
+class StateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.game = Board.new(4, 4, 2, seed=1234)
+        assert self.game is not None
+        # One match and one selected cell
+        first = self.game.items[0]
+        pair = [i for i in range(1, 16) if self.game.items[i] == first][0]
+        other = [i for i in range(1, 16) if self.game.items[i] != first][0]
+        play(self.game, [0, pair, other])
+        self.game.start_time = 100.0
+        self.game.last_active = 200.0
+
+    def restore(self, state: tuple) -> Board:
+        restored = Board.__new__(Board)
+        restored.__setstate__(state)
+        return restored
+
+    def assertSameGame(self, restored: Board, last_active: float = 200.0) -> None:
+        self.assertEqual(restored.items, self.game.items)
+        self.assertEqual(restored.revealed, self.game.revealed)
+        self.assertEqual(restored.permanent, self.game.permanent)
+        self.assertEqual(restored.selection, self.game.selection)
+        self.assertEqual(restored.selected, self.game.selected)
+        self.assertEqual(restored.selection_mismatch, self.game.selection_mismatch)
+        self.assertEqual(restored.matched_groups, 1)
+        self.assertEqual(restored.last_matched, self.game.last_matched)
+        self.assertEqual(restored.start_time, 100.0)
+        self.assertEqual(restored.last_active, last_active)
+        self.assertEqual(restored.pool, board.EMOJI_POOLS[1])
+        self.assertIsNone(restored.render_cache)
+
+    def progress(self) -> tuple:
+        game = self.game
+        return (
+            game.revealed,
+            game.permanent,
+            tuple(game.selection),
+            game.matched_groups,
+            game.last_matched,
+        )
+
+    def test_version_1(self) -> None:
+        state = (1, 4, 4, 2, bytes(self.game.items)) + self.progress() + (100.0,)
+        self.assertSameGame(self.restore(state), last_active=100.0)
+
+    def test_version_2(self) -> None:
+        state = (2, 4, 4, 2, bytes(self.game.items)) + self.progress() + (100.0, 200.0)
+        self.assertSameGame(self.restore(state))
+
+    def test_version_3(self) -> None:
+        state = (
+            (3, 4, 4, 2, bytes(self.game.items)) + self.progress() + (100.0, 200.0, 1)
+        )
+        restored = self.restore(state)
+        self.assertSameGame(restored)
+        self.assertIsNone(restored.seed)
+
+    def test_version_4(self) -> None:
+        state = (4, 4, 4, 2, 1234, None) + self.progress() + (100.0, 200.0, 1)
+        restored = self.restore(state)
+        self.assertSameGame(restored)
+        self.assertEqual(restored.seed, 1234)
+
+    def test_current_version_round_trip(self) -> None:
+        state = self.game.__getstate__()
+        self.assertEqual(state[0], board.BOARD_STATE_VERSION)
+        self.assertIsNone(state[5])
+        self.assertEqual(state[-1], zlib.crc32(self.game.items))
+        self.assertSameGame(pickle.loads(pickle.dumps(self.game)))
+
+    def test_unseeded_board_stores_its_layout(self) -> None:
+        self.game.seed = None
+        state = self.game.__getstate__()
+        self.assertEqual(state[5], bytes(self.game.items))
+        self.assertIsNone(state[-1])
+        self.assertSameGame(pickle.loads(pickle.dumps(self.game)))
+
+    def test_changed_shuffle_restarts_the_game(self) -> None:
+        data = pickle.dumps(self.game)
+        generate = board.generate_item_indices
+
+        def reversed_layout(*args: object) -> List[int]:
+            return generate(*args)[::-1]  # type: ignore[index]
+
+        with mock.patch.object(board, "generate_item_indices", reversed_layout):
+            with self.assertLogs(level="WARNING"):
+                restored = pickle.loads(data)
+
+        self.assertEqual(restored.items, self.game.items[::-1])
+        self.assertEqual(restored.revealed, 0)
+        self.assertEqual(restored.permanent, 0)
+        self.assertEqual(restored.selection, [])
+        self.assertEqual(restored.selected, 0)
+        self.assertEqual(restored.matched_groups, 0)
+        self.assertFalse(restored.is_won())
@@ -0,0 +1,57 @@
+import unittest
+
+from board_pool import BoardPool
+
+
+class BoardPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.pool = BoardPool(size=2, max_configs=1, window=3)
+
+    async def asyncTearDown(self) -> None:
+        await self.pool.close()
+
+    async def test_first_board_is_shuffled_then_pooled(self) -> None:
+        self.assertIsNotNone(self.pool.take(4, 4, 2))
+        self.assertEqual(self.pool.stats["misses"], 1)
+        await self.pool.refill()
+        self.assertEqual(len(self.pool), 2)
+
+        board = self.pool.take(4, 4, 2)
+        assert board is not None
+        self.assertEqual(self.pool.stats["hits"], 1)
+        self.assertEqual((board.size_x, board.size_y, board.match_count), (4, 4, 2))
+        self.assertGreater(board.start_time, 0)
+
+    async def test_invalid_config_is_not_counted(self) -> None:
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(self.pool.take(3, 3, 2))
+        self.assertEqual(self.pool.popular_configs(), [])
+
+    async def test_popular_configs_follow_the_window(self) -> None:
+        for config in [(4, 4, 2), (4, 4, 2), (3, 4, 3)]:
+            self.pool.take(*config)
+        self.assertEqual(self.pool.popular_configs(), [(4, 4, 2)])
+
+        for _ in range(2):
+            self.pool.take(3, 4, 3)
+        self.assertEqual(list(self.pool.recent), [(3, 4, 3)] * 3)
+        self.assertEqual(self.pool.requests, {(3, 4, 3): 3})
+        self.assertEqual(self.pool.popular_configs(), [(3, 4, 3)])
+
+    async def test_refill_drops_configs_no_longer_popular(self) -> None:
+        self.pool.take(4, 4, 2)
+        await self.pool.refill()
+        for _ in range(3):
+            self.pool.take(3, 4, 3)
+        await self.pool.refill()
+
+        self.assertEqual(list(self.pool._boards), [(3, 4, 3)])
+        self.assertEqual(len(self.pool), 2)
+
+    async def test_size_zero_disables_pooling(self) -> None:
+        pool = BoardPool(size=0)
+        pool.take(4, 4, 2)
+        pool.take(4, 4, 2)
+
+        self.assertEqual(pool.stats["misses"], 2)
+        self.assertIsNone(pool._refill_task)
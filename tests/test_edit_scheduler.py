@@ -0,0 +1,103 @@
+import asyncio
+import time
+import unittest
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from edit_scheduler import EditScheduler
+
+
+class EditSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.started = time.perf_counter()
+        # (edit, seconds since the test started) of every finished edit
+        self.edits: List[Tuple[str, float]] = []
+        self.running: Dict[str, int] = {}
+
+    def edit(
+        self, name: str, duration: float = 0.0, message: str = "message"
+    ) -> Callable[[], Awaitable[None]]:
+        async def perform() -> None:
+            self.running[message] = self.running.get(message, 0) + 1
+            self.assertEqual(self.running[message], 1, "edits of one message overlap")
+            await asyncio.sleep(duration)
+            self.running[message] -= 1
+            self.edits.append((name, time.perf_counter() - self.started))
+
+        return perform
+
+    async def test_first_edit_is_performed_immediately(self) -> None:
+        scheduler = EditScheduler(delay=0.3)
+        await scheduler.submit("message", self.edit("first"))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual([name for name, _ in self.edits], ["first"])
+        self.assertLess(self.edits[0][1], 0.05)
+        await scheduler.flush()
+
+    async def test_burst_is_coalesced_into_one_trailing_edit(self) -> None:
+        scheduler = EditScheduler(delay=0.1)
+        await scheduler.submit("message", self.edit("first", 0.02))
+        await asyncio.sleep(0.01)
+        for name in ("second", "third", "fourth"):
+            await scheduler.submit("message", self.edit(name, 0.02))
+        await asyncio.sleep(0.25)
+
+        self.assertEqual([name for name, _ in self.edits], ["first", "fourth"])
+        self.assertGreaterEqual(self.edits[1][1], 0.1)
+        self.assertEqual(scheduler.coalesced, 2)
+        self.assertEqual(scheduler._tasks, {})
+
+    async def test_messages_are_edited_independently(self) -> None:
+        scheduler = EditScheduler(delay=0.3)
+        await scheduler.submit("one", self.edit("one", message="one"))
+        await scheduler.submit("two", self.edit("two", message="two"))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(sorted(name for name, _ in self.edits), ["one", "two"])
+        await scheduler.flush()
+
+    async def test_zero_delay_edits_on_every_submit(self) -> None:
+        scheduler = EditScheduler(delay=0)
+        await scheduler.submit("message", self.edit("first"))
+        await scheduler.submit("message", self.edit("second"))
+
+        self.assertEqual([name for name, _ in self.edits], ["first", "second"])
+
+    async def test_flush_performs_waiting_edits(self) -> None:
+        scheduler = EditScheduler(delay=10)
+        await scheduler.submit("message", self.edit("first"))
+        await asyncio.sleep(0.01)
+        await scheduler.submit("message", self.edit("second"))
+        await scheduler.flush()
+
+        self.assertEqual([name for name, _ in self.edits], ["first", "second"])
+
+    async def test_flush_waits_for_edits_in_progress(self) -> None:
+        scheduler = EditScheduler(delay=10)
+        await scheduler.submit("message", self.edit("first", 0.05))
+        await asyncio.sleep(0.01)
+        await scheduler.submit("message", self.edit("second"))
+        await scheduler.flush()
+
+        self.assertEqual([name for name, _ in self.edits], ["first", "second"])
+
+    async def test_flush_performs_edits_not_started_yet(self) -> None:
+        scheduler = EditScheduler(delay=10)
+        await scheduler.submit("message", self.edit("first"))
+        await scheduler.flush()
+
+        self.assertEqual([name for name, _ in self.edits], ["first"])
+
+    async def test_failed_edit_does_not_stop_the_next(self) -> None:
+        scheduler = EditScheduler(delay=0.05)
+
+        async def fail() -> None:
+            raise RuntimeError("message not found")
+
+        with self.assertLogs(level="ERROR"):
+            await scheduler.submit("message", fail)
+            await asyncio.sleep(0.01)
+        await scheduler.submit("message", self.edit("second"))
+        await asyncio.sleep(0.1)
+
+        self.assertEqual([name for name, _ in self.edits], ["second"])
@@ -0,0 +1,74 @@
+import unittest
+
+import engine
+from engine import (
+    DIMENSIONS_OK,
+    DIMENSIONS_OUT_OF_RANGE,
+    DIMENSIONS_TOO_FEW_CELLS,
+    MATCH_COUNT_NOT_DIVISOR,
+    MATCH_COUNT_OK,
+    MATCH_COUNT_OUT_OF_RANGE,
+    MATCH_COUNT_TOO_FEW_GROUPS,
+    MAX_SIZE_X,
+    MAX_SIZE_Y,
+    check_dimensions,
+    check_match_count,
+)
+
+
+class CheckDimensionsTest(unittest.TestCase):
+    def test_valid_dimensions(self) -> None:
+        self.assertEqual(check_dimensions(4, 4), DIMENSIONS_OK)
+        self.assertEqual(check_dimensions(1, 2), DIMENSIONS_OK)
+        self.assertEqual(check_dimensions(MAX_SIZE_X, MAX_SIZE_Y), DIMENSIONS_OK)
+
+    def test_out_of_range(self) -> None:
+        for size_x, size_y in ((0, 4), (4, 0), (-1, 4), (MAX_SIZE_X + 1, 4)):
+            self.assertEqual(check_dimensions(size_x, size_y), DIMENSIONS_OUT_OF_RANGE)
+        self.assertEqual(check_dimensions(4, MAX_SIZE_Y + 1), DIMENSIONS_OUT_OF_RANGE)
+
+    def test_single_cell(self) -> None:
+        self.assertEqual(check_dimensions(1, 1), DIMENSIONS_TOO_FEW_CELLS)
+
+
+class CheckMatchCountTest(unittest.TestCase):
+    def test_valid_match_counts(self) -> None:
+        self.assertEqual(check_match_count(4, 4, 2), MATCH_COUNT_OK)
+        self.assertEqual(check_match_count(3, 4, 3), MATCH_COUNT_OK)
+        self.assertEqual(check_match_count(6, 6, 9), MATCH_COUNT_OK)
+
+    def test_out_of_range(self) -> None:
+        self.assertEqual(check_match_count(4, 4, 1), MATCH_COUNT_OUT_OF_RANGE)
+        self.assertEqual(check_match_count(4, 4, 0), MATCH_COUNT_OUT_OF_RANGE)
+        self.assertEqual(check_match_count(2, 2, 5), MATCH_COUNT_OUT_OF_RANGE)
+
+    def test_not_a_divisor(self) -> None:
+        self.assertEqual(check_match_count(3, 3, 2), MATCH_COUNT_NOT_DIVISOR)
+
+    def test_single_group(self) -> None:
+        self.assertEqual(check_match_count(2, 2, 4), MATCH_COUNT_TOO_FEW_GROUPS)
+
+    def test_every_accepted_config_can_be_played(self) -> None:
+        for size_x in range(1, MAX_SIZE_X + 1):
+            for size_y in range(1, MAX_SIZE_Y + 1):
+                if check_dimensions(size_x, size_y) != DIMENSIONS_OK:
+                    continue
+                for match_count in range(2, size_x * size_y + 1):
+                    if check_match_count(size_x, size_y, match_count) == MATCH_COUNT_OK:
+                        self.assertIsNotNone(
+                            engine.new_game(size_x, size_y, match_count, seed=1)
+                        )
+
+
+class ReplayTest(unittest.TestCase):
+    def test_replay_repeats_the_game(self) -> None:
+        game = engine.new_game(4, 4, 2, seed=7)
+        assert game is not None
+        taps = [0, 1, 2, 3, 4, 5]
+        outcomes = [engine.tap(game, index) for index in taps]
+
+        result = engine.replay(4, 4, 2, 7, taps)
+        assert result is not None
+        replayed, replayed_outcomes = result
+        self.assertEqual(replayed_outcomes, outcomes)
+        self.assertEqual(engine.render_state(replayed), engine.render_state(game))
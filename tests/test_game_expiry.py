@@ -0,0 +1,53 @@
+import time
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from board import Board
+from game_expiry import GameExpiry
+
+TTL = 60
+
+
+def user_data(idle: float, won: bool = False) -> Dict[Any, Any]:
+    board = Board(2, 2, 2, bytearray([0, 1, 1, 0]), time.time() - idle)
+    if won:
+        for index in (0, 3, 1, 2):
+            board.tap(index)
+        board.last_active = time.time() - idle
+    return {"board": board, "board_message": (1, 2), "board_size_x": 2}
+
+
+class ExpireTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.expiry = GameExpiry(TTL)
+        self.notices: List[Tuple[int, Any]] = []
+
+    def test_idle_board_is_removed_with_a_notice(self) -> None:
+        data = user_data(idle=TTL + 1)
+        self.assertTrue(self.expiry._expire(1, data, self.notices))
+
+        self.assertEqual(data, {"board_size_x": 2})
+        self.assertEqual(self.notices, [(1, (1, 2))])
+
+    def test_idle_won_board_is_removed_without_a_notice(self) -> None:
+        data = user_data(idle=TTL + 1, won=True)
+        self.assertTrue(data["board"].is_won())
+        self.assertTrue(self.expiry._expire(1, data, self.notices))
+
+        self.assertEqual(data, {"board_size_x": 2})
+        self.assertEqual(self.notices, [])
+
+    def test_active_board_is_kept(self) -> None:
+        data = user_data(idle=TTL - 10)
+        self.assertFalse(self.expiry._expire(1, data, self.notices))
+
+        self.assertIn("board", data)
+        self.assertEqual(self.notices, [])
+
+    def test_legacy_game_state_is_dropped(self) -> None:
+        data = {"board_cells": [0, 1], "game_start_time": 1.0, "match_count": 2}
+        self.assertTrue(self.expiry._expire(1, data, self.notices))
+
+        self.assertEqual(data, {"match_count": 2})
+        self.assertEqual(self.notices, [])
+        self.assertFalse(self.expiry._expire(1, data, self.notices))
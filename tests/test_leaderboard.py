@@ -0,0 +1,166 @@
+import json
+import os
+import tempfile
+import unittest
+
+from leaderboard import SCORES_HEADER, SCORES_PAGE_SIZE, Leaderboard
+
+
+class LeaderboardTest(unittest.TestCase):
+    def test_keeps_the_fastest_entries(self) -> None:
+        leaderboard = Leaderboard(max_entries=3)
+        for name, time_taken in [("a", 5.0), ("b", 3.0), ("c", 4.0), ("d", 1.0)]:
+            leaderboard.add("4x4_match2", name, time_taken)
+
+        self.assertEqual(
+            leaderboard.top("4x4_match2"),
+            [
+                {"name": "d", "time": 1.0},
+                {"name": "b", "time": 3.0},
+                {"name": "c", "time": 4.0},
+            ],
+        )
+        self.assertEqual(leaderboard.top("4x4_match2", 1), [{"name": "d", "time": 1.0}])
+
+    def test_slower_scores_do_not_qualify_once_full(self) -> None:
+        leaderboard = Leaderboard(max_entries=2)
+        leaderboard.add("4x4_match2", "a", 1.0)
+        leaderboard.add("4x4_match2", "b", 2.0)
+
+        self.assertFalse(leaderboard.qualifies("4x4_match2", 2.0))
+        self.assertFalse(leaderboard.add("4x4_match2", "c", 3.0))
+        self.assertTrue(leaderboard.qualifies("2x2_match2", 100.0))
+
+    def test_equal_times_evict_the_most_recent_entry(self) -> None:
+        leaderboard = Leaderboard(max_entries=2)
+        leaderboard.add("4x4_match2", "a", 1.0)
+        leaderboard.add("4x4_match2", "b", 2.0)
+        leaderboard.add("4x4_match2", "c", 2.0)
+        leaderboard.add("4x4_match2", "d", 1.5)
+
+        self.assertEqual(
+            [entry["name"] for entry in leaderboard.top("4x4_match2")], ["a", "d"]
+        )
+
+    def test_legacy_tables_are_merged(self) -> None:
+        leaderboard = Leaderboard(max_entries=10)
+        with self.assertLogs(level="WARNING"):
+            leaderboard.update_from(
+                {
+                    "4x4_match2": [{"name": "a", "time": 1.0}, {"name": "b"}],
+                    "not_scores": 1,
+                }
+            )
+
+        self.assertEqual(leaderboard.configs(), ["4x4_match2"])
+        self.assertEqual(leaderboard.top("4x4_match2"), [{"name": "a", "time": 1.0}])
+
+
+class SaveTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "leaderboard.json")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self) -> None:
+        leaderboard = Leaderboard(max_entries=10, filepath=self.filepath)
+        leaderboard.add("4x4_match2", "a", 1.0)
+        leaderboard.save()
+        self.assertFalse(leaderboard.dirty)
+
+        loaded = Leaderboard(max_entries=10, filepath=self.filepath)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.as_dict(), leaderboard.as_dict())
+        self.assertFalse(loaded.dirty)
+
+    def test_load_without_file(self) -> None:
+        self.assertFalse(Leaderboard(max_entries=10, filepath=self.filepath).load())
+
+    def test_unchanged_tables_are_not_written(self) -> None:
+        leaderboard = Leaderboard(max_entries=10, filepath=self.filepath)
+        leaderboard.save()
+        self.assertFalse(os.path.exists(self.filepath))
+
+    def test_failed_write_is_retried(self) -> None:
+        leaderboard = Leaderboard(
+            max_entries=10, filepath=os.path.join(self.filepath, "missing", "x.json")
+        )
+        leaderboard.add("4x4_match2", "a", 1.0)
+        with self.assertRaises(OSError):
+            leaderboard.save()
+        self.assertTrue(leaderboard.dirty)
+
+        leaderboard.filepath = self.filepath
+        leaderboard.save()
+        with open(self.filepath, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), leaderboard.as_dict())
+
+
+class SectionCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.leaderboard = Leaderboard(max_entries=10)
+        self.leaderboard.add("4x4_match2", "a", 1.0)
+        self.leaderboard.add("2x2_match2", "b", 2.0)
+
+    def test_section_is_cached_until_its_config_changes(self) -> None:
+        section = self.leaderboard.section_text("4x4_match2")
+        self.assertIn("a: 1.00", section)
+
+        self.leaderboard.add("2x2_match2", "c", 3.0)
+        self.assertIs(self.leaderboard.section_text("4x4_match2"), section)
+
+        self.leaderboard.add("4x4_match2", "d", 0.5)
+        section = self.leaderboard.section_text("4x4_match2")
+        self.assertLess(section.index("d: 0.50"), section.index("a: 1.00"))
+
+    def test_rejected_score_keeps_the_section(self) -> None:
+        leaderboard = Leaderboard(max_entries=1)
+        leaderboard.add("4x4_match2", "a", 1.0)
+        section = leaderboard.section_text("4x4_match2")
+        leaderboard.add("4x4_match2", "b", 2.0)
+
+        self.assertIs(leaderboard.section_text("4x4_match2"), section)
+
+
+class PageTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.leaderboard = Leaderboard(max_entries=10)
+        # Two full pages and one with a single configuration
+        for size_x in range(1, SCORES_PAGE_SIZE * 2 + 2):
+            self.leaderboard.add(f"{size_x:02}x2_match2", "a", 1.0)
+
+    def test_configs_are_paged_in_order(self) -> None:
+        self.assertEqual(self.leaderboard.page_count, 3)
+        first_page = self.leaderboard.page_text(0)
+        assert first_page is not None
+        self.assertTrue(first_page.startswith(SCORES_HEADER))
+        self.assertLess(first_page.index("01x2"), first_page.index("02x2"))
+        self.assertNotIn(f"{SCORES_PAGE_SIZE + 1:02}x2", first_page)
+        self.assertIsNone(self.leaderboard.page_text(3))
+        self.assertIsNone(self.leaderboard.page_text(-1))
+
+    def test_new_score_only_invalidates_its_page(self) -> None:
+        pages = [self.leaderboard.page_text(page) for page in range(3)]
+        self.leaderboard.add(f"{SCORES_PAGE_SIZE + 1:02}x2_match2", "b", 0.5)
+
+        self.assertIs(self.leaderboard.page_text(0), pages[0])
+        self.assertIsNot(self.leaderboard.page_text(1), pages[1])
+        self.assertIs(self.leaderboard.page_text(2), pages[2])
+
+    def test_new_config_invalidates_the_pages_it_shifts(self) -> None:
+        pages = [self.leaderboard.page_text(page) for page in range(3)]
+        self.leaderboard.add(f"{SCORES_PAGE_SIZE + 1:02}x1_match2", "b", 1.0)
+
+        self.assertIs(self.leaderboard.page_text(0), pages[0])
+        self.assertIsNot(self.leaderboard.page_text(1), pages[1])
+        self.assertIsNot(self.leaderboard.page_text(2), pages[2])
+        self.assertEqual(self.leaderboard.page_count, 3)
+        self.assertIn(f"{SCORES_PAGE_SIZE * 2:02}x2", self.leaderboard.page_text(2))
+
+    def test_config_text(self) -> None:
+        text = self.leaderboard.config_text("01x2_match2")
+        assert text is not None
+        self.assertIn("01x2", text)
+        self.assertIsNone(self.leaderboard.config_text("9x9_match3"))
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from typing import Any, Dict
+
+from board import Board
+from persistence import SQLitePersistence
+
+
+class SQLitePersistenceTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "persistence.sqlite3")
+        self.opened: list = []
+
+    async def asyncTearDown(self) -> None:
+        for persistence in self.opened:
+            await persistence.flush()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def open(self, **kwargs: Any) -> SQLitePersistence:
+        persistence = SQLitePersistence(self.filepath, **kwargs)
+        self.opened.append(persistence)
+        return persistence
+
+    async def reopen(
+        self, persistence: SQLitePersistence, **kwargs: Any
+    ) -> SQLitePersistence:
+        await persistence.flush()
+        self.opened.remove(persistence)
+        return self.open(**kwargs)
+
+    async def store_users(self, users: Dict[int, Dict[Any, Any]]) -> None:
+        persistence = self.open()
+        for user_id, data in users.items():
+            await persistence.update_user_data(user_id, data)
+        await persistence.flush()
+        self.opened.remove(persistence)
+
+
+class RoundTripTest(SQLitePersistenceTestCase):
+    async def test_data_round_trips(self) -> None:
+        persistence = self.open()
+        await persistence.update_user_data(1, {"value": 1})
+        await persistence.update_chat_data(-2, {"value": 2})
+        await persistence.update_bot_data({"4x4_match2": [3]})
+        await persistence.update_callback_data(([], {}))
+        persistence = await self.reopen(persistence)
+
+        self.assertEqual(await persistence.get_user_data(), {1: {"value": 1}})
+        self.assertEqual(await persistence.get_chat_data(), {-2: {"value": 2}})
+        self.assertEqual(await persistence.get_bot_data(), {"4x4_match2": [3]})
+        self.assertEqual(await persistence.get_callback_data(), ([], {}))
+
+    async def test_empty_database(self) -> None:
+        persistence = self.open()
+        self.assertEqual(await persistence.get_user_data(), {})
+        self.assertIsNone(await persistence.get_callback_data())
+
+    async def test_dropped_user_data_is_deleted(self) -> None:
+        await self.store_users({1: {"value": 1}, 2: {"value": 2}})
+        persistence = self.open()
+        await persistence.drop_user_data(1)
+        persistence = await self.reopen(persistence)
+
+        self.assertEqual(await persistence.get_user_data(), {2: {"value": 2}})
+
+    async def test_conversations_round_trip(self) -> None:
+        persistence = self.open()
+        await persistence.update_conversation("game", (1, 1), 2)
+        await persistence.update_conversation("game", (2, 2), 3)
+        await persistence.update_conversation("game", (2, 2), None)
+        await persistence.update_conversation("other", (1, 1), 4)
+        persistence = await self.reopen(persistence)
+
+        self.assertEqual(await persistence.get_conversations("game"), {(1, 1): 2})
+
+
+class WriteTest(SQLitePersistenceTestCase):
+    async def test_repeated_updates_coalesce_into_one_write(self) -> None:
+        persistence = self.open()
+        for value in range(5):
+            await persistence.update_user_data(1, {"value": value})
+        await persistence.flush()
+
+        self.assertEqual(persistence.flush_stats["rows_written"], 1)
+        persistence = await self.reopen(persistence)
+        self.assertEqual(await persistence.get_user_data(), {1: {"value": 4}})
+
+    async def test_unchanged_rows_are_skipped(self) -> None:
+        persistence = self.open()
+        await persistence.update_user_data(1, {"value": 1})
+        await persistence.update_chat_data(2, {"value": 2})
+        await persistence.flush()
+        written = persistence.flush_stats["rows_written"]
+
+        await persistence.update_user_data(1, {"value": 1})
+        await persistence.update_chat_data(2, {"value": 2})
+        await persistence.flush()
+
+        self.assertEqual(persistence.flush_stats["rows_written"], written)
+        self.assertEqual(persistence.flush_stats["rows_skipped"], 2)
+
+    async def test_reverted_change_drops_the_pending_write(self) -> None:
+        await self.store_users({1: {"value": 1}})
+        persistence = self.open()
+        await persistence.get_user_data()
+
+        await persistence.update_user_data(1, {"value": 2})
+        await persistence.update_user_data(1, {"value": 1})
+        await persistence.flush()
+
+        self.assertEqual(persistence.flush_stats["rows_written"], 0)
+
+    async def test_change_reverted_while_being_written_is_written(self) -> None:
+        await self.store_users({1: {"value": 1}})
+        persistence = self.open()
+        await persistence.get_user_data()
+
+        await persistence.update_user_data(1, {"value": 2})
+        # Let the write task hand the row to the database thread
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertIn(("user_data", (1,)), persistence._writing)
+        await persistence.update_user_data(1, {"value": 1})
+        persistence = await self.reopen(persistence)
+
+        self.assertEqual(await persistence.get_user_data(), {1: {"value": 1}})
+
+    async def test_writes_are_batched(self) -> None:
+        persistence = self.open(max_batch_size=2)
+        for user_id in range(5):
+            await persistence.update_user_data(user_id, {"value": user_id})
+        await persistence.flush()
+
+        self.assertEqual(persistence.flush_stats["rows_written"], 5)
+        self.assertEqual(persistence.flush_stats["flushes"], 3)
+        self.assertEqual(persistence.flush_stats["last_batch_size"], 1)
+
+    async def test_removed_bot_data_keys_are_deleted(self) -> None:
+        persistence = self.open()
+        await persistence.update_bot_data({"4x4_match2": [1], "2x2_match2": [2]})
+        persistence = await self.reopen(persistence)
+        self.assertEqual(
+            await persistence.get_bot_data(), {"4x4_match2": [1], "2x2_match2": [2]}
+        )
+
+        await persistence.update_bot_data({"2x2_match2": [2]})
+        persistence = await self.reopen(persistence)
+
+        self.assertEqual(await persistence.get_bot_data(), {"2x2_match2": [2]})
+
+
+class LazyUserDataTest(SQLitePersistenceTestCase):
+    async def test_user_data_is_loaded_on_refresh(self) -> None:
+        await self.store_users({1: {"value": 1}, 2: {"value": 2}})
+        persistence = self.open(lazy_user_data=True)
+
+        self.assertEqual(await persistence.get_user_data(), {})
+        user_data: Dict[Any, Any] = {}
+        await persistence.refresh_user_data(1, user_data)
+        await persistence.refresh_user_data(1, user_data)
+
+        self.assertEqual(user_data, {"value": 1})
+        self.assertEqual(persistence.cache_stats["loads"], 1)
+        self.assertEqual(persistence.cache_stats["hits"], 1)
+
+    async def test_least_recently_used_user_is_paged_out_and_back_in(self) -> None:
+        await self.store_users({1: {"value": 1}, 2: {"value": 2}})
+        persistence = self.open(lazy_user_data=True, max_resident_users=1)
+        first: Dict[Any, Any] = {}
+        second: Dict[Any, Any] = {}
+        await persistence.refresh_user_data(1, first)
+        first["value"] = 10
+
+        await persistence.refresh_user_data(2, second)
+        self.assertEqual(first, {})
+        self.assertEqual(persistence.cache_stats["page_outs"], 1)
+
+        # Read back from the pending write, then from the database
+        await persistence.refresh_user_data(1, first)
+        self.assertEqual(first, {"value": 10})
+        persistence = await self.reopen(persistence, lazy_user_data=True)
+        user_data: Dict[Any, Any] = {}
+        await persistence.refresh_user_data(1, user_data)
+        self.assertEqual(user_data, {"value": 10})
+
+    async def test_updates_of_paged_out_users_are_ignored(self) -> None:
+        await self.store_users({1: {"value": 1}, 2: {"value": 2}})
+        persistence = self.open(lazy_user_data=True, max_resident_users=1)
+        first: Dict[Any, Any] = {}
+        await persistence.refresh_user_data(1, first)
+        await persistence.refresh_user_data(2, {})
+
+        # PTB hands over a copy of the emptied dict on its next flush
+        await persistence.update_user_data(1, {})
+        persistence = await self.reopen(persistence, lazy_user_data=True)
+        await persistence.refresh_user_data(1, first)
+
+        self.assertEqual(first, {"value": 1})
+
+    async def test_user_with_update_in_flight_is_not_paged_out(self) -> None:
+        await self.store_users(
+            {user_id: {"board": Board.new(4, 4, 2)} for user_id in range(3)}
+        )
+        persistence = self.open(lazy_user_data=True, max_resident_users=2)
+        user_data: Dict[int, Dict[Any, Any]] = {user_id: {} for user_id in range(3)}
+        tap = asyncio.Event()
+
+        async def process_update_of_first_user() -> None:
+            await persistence.refresh_user_data(0, user_data[0])
+            board = user_data[0]["board"]
+            await tap.wait()
+            board.tap(0)
+            await persistence.update_user_data(0, user_data[0])
+
+        first_update = asyncio.create_task(process_update_of_first_user())
+        await asyncio.sleep(0.01)
+        for user_id in (1, 2):
+            await asyncio.create_task(
+                persistence.refresh_user_data(user_id, user_data[user_id])
+            )
+        tap.set()
+        await first_update
+
+        self.assertEqual(list(persistence._resident), [0, 2])
+        self.assertEqual(persistence.cache_stats["page_outs_deferred"], 1)
+        persistence = await self.reopen(persistence, lazy_user_data=True)
+        reloaded: Dict[Any, Any] = {}
+        await persistence.refresh_user_data(0, reloaded)
+        self.assertEqual(reloaded["board"].revealed, 1)
+
+    async def test_paged_out_user_data_can_be_updated(self) -> None:
+        await self.store_users({user_id: {"value": user_id} for user_id in range(5)})
+        persistence = self.open(
+            lazy_user_data=True, max_resident_users=1, max_batch_size=2
+        )
+        await persistence.refresh_user_data(0, {})
+        visited = []
+
+        def increment(user_id: int, data: Dict[Any, Any]) -> bool:
+            visited.append(user_id)
+            data["value"] += 10
+            return user_id % 2 == 0
+
+        self.assertEqual(await persistence.update_paged_out_user_data(increment, 3), 1)
+        self.assertEqual(await persistence.update_paged_out_user_data(increment, 3), 1)
+        self.assertEqual(visited, [1, 2, 3, 4])
+
+        persistence = await self.reopen(persistence)
+        self.assertEqual(
+            await persistence.get_user_data(),
+            {
+                0: {"value": 0},
+                1: {"value": 1},
+                2: {"value": 12},
+                3: {"value": 3},
+                4: {"value": 14},
+            },
+        )
@@ -0,0 +1,88 @@
+import time
+import unittest
+from typing import Any, Dict, List
+
+from telegram.error import RetryAfter
+
+from rate_limiter import TokenBucket, TokenBucketRateLimiter
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self) -> None:
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        # Reservations queue up behind each other
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+        self.assertFalse(bucket.is_full())
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.calls: List[float] = []
+        self.failures = 0
+
+    async def callback(self) -> str:
+        self.calls.append(time.monotonic())
+        if self.failures:
+            self.failures -= 1
+            raise RetryAfter(0.1)
+        return "ok"
+
+    async def request(
+        self,
+        limiter: TokenBucketRateLimiter,
+        endpoint: str = "editMessageText",
+        data: Dict[str, Any] | None = None,
+        rate_limit_args: int | None = None,
+    ) -> Any:
+        return await limiter.process_request(
+            self.callback,
+            (),
+            {},
+            endpoint,
+            {"chat_id": 1} if data is None else data,
+            rate_limit_args,
+        )
+
+    async def test_requests_of_one_chat_are_spaced(self) -> None:
+        limiter = TokenBucketRateLimiter(chat_rate=20, chat_burst=1)
+        for _ in range(3):
+            await self.request(limiter)
+
+        self.assertGreaterEqual(self.calls[2] - self.calls[0], 0.09)
+        self.assertEqual(limiter.stats["delayed"], 2)
+
+    async def test_priority_endpoints_skip_the_buckets(self) -> None:
+        limiter = TokenBucketRateLimiter(chat_rate=1, chat_burst=1)
+        await self.request(limiter)
+        await self.request(limiter, endpoint="answerCallbackQuery")
+
+        self.assertLess(self.calls[1] - self.calls[0], 0.05)
+        self.assertEqual(limiter.stats["delayed"], 0)
+
+    async def test_retry_after_pauses_and_retries(self) -> None:
+        limiter = TokenBucketRateLimiter()
+        self.failures = 2
+        self.assertEqual(await self.request(limiter), "ok")
+
+        self.assertEqual(len(self.calls), 3)
+        self.assertGreaterEqual(self.calls[1] - self.calls[0], 0.2)
+        self.assertEqual(limiter.stats["retry_after"], 2)
+
+    async def test_gives_up_after_max_retries(self) -> None:
+        limiter = TokenBucketRateLimiter(max_retries=1)
+        self.failures = 5
+        with self.assertLogs(level="ERROR"), self.assertRaises(RetryAfter):
+            await self.request(limiter)
+
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_rate_limit_args_override_max_retries(self) -> None:
+        limiter = TokenBucketRateLimiter(max_retries=3)
+        self.failures = 5
+        with self.assertLogs(level="ERROR"), self.assertRaises(RetryAfter):
+            await self.request(limiter, rate_limit_args=0)
+
+        self.assertEqual(len(self.calls), 1)
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor
+
+
+def user_update(update_id: int, user_id: int) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name="Test", is_bot=False),
+        text="x",
+    )
+    return Update(update_id=update_id, message=message)
+
+
+class PerUserUpdateProcessorTest(unittest.IsolatedAsyncioTestCase):
+    async def run_updates(
+        self, processor: PerUserUpdateProcessor, updates: List[Tuple[int, float]]
+    ) -> Tuple[List[Tuple[str, int, int]], int]:
+        """Processes (user_id, duration) pairs, returns events and peak concurrency."""
+        events: List[Tuple[str, int, int]] = []
+        running = 0
+        peak = 0
+
+        async def handle(update_id: int, user_id: int, duration: float) -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            events.append(("start", user_id, update_id))
+            await asyncio.sleep(duration)
+            events.append(("end", user_id, update_id))
+            running -= 1
+
+        await asyncio.gather(
+            *(
+                processor.process_update(
+                    user_update(update_id, user_id),
+                    handle(update_id, user_id, duration),
+                )
+                for update_id, (user_id, duration) in enumerate(updates)
+            )
+        )
+        return events, peak
+
+    async def test_updates_of_one_user_run_in_order_one_at_a_time(self) -> None:
+        processor = PerUserUpdateProcessor(workers=4)
+        events, peak = await self.run_updates(
+            processor, [(1, 0.03), (1, 0.01), (1, 0.0)]
+        )
+
+        self.assertEqual(peak, 1)
+        self.assertEqual(
+            events,
+            [
+                ("start", 1, 0),
+                ("end", 1, 0),
+                ("start", 1, 1),
+                ("end", 1, 1),
+                ("start", 1, 2),
+                ("end", 1, 2),
+            ],
+        )
+        self.assertEqual(processor._locks, {})
+
+    async def test_users_run_concurrently_up_to_the_worker_limit(self) -> None:
+        processor = PerUserUpdateProcessor(workers=2)
+        events, peak = await self.run_updates(
+            processor, [(1, 0.02), (2, 0.02), (3, 0.02), (1, 0.0)]
+        )
+
+        self.assertEqual(peak, 2)
+        self.assertLess(events.index(("end", 1, 0)), events.index(("start", 1, 3)))
+
+    async def test_waiting_updates_do_not_hold_a_worker(self) -> None:
+        processor = PerUserUpdateProcessor(workers=1)
+        events, _ = await self.run_updates(processor, [(1, 0.02), (1, 0.02), (2, 0.0)])
+
+        # The second update of user 1 waits for its lock, not for the worker
+        self.assertLess(events.index(("end", 2, 2)), events.index(("start", 1, 1)))
+
+    def test_workers_must_be_positive(self) -> None:
+        with self.assertRaises(ValueError):
+            PerUserUpdateProcessor(workers=0)
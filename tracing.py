@@ -0,0 +1,249 @@
+import cProfile
+import functools
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterator, TypeVar
+
+from telegram.ext import BaseRateLimiter, BaseUpdateProcessor
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+T = TypeVar("T")
+
+# Segments a span is split into; whatever is left over is reported as "other"
+SEGMENTS = ("game", "bot_api", "rate_limit", "persistence")
+
+
+class Span:
+    """Timing of one update or scheduled edit, split by where the time went."""
+
+    __slots__ = ("handler", "user_id", "started", "duration", "segments")
+
+    def __init__(self, handler: str, user_id: int | None) -> None:
+        self.handler = handler
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.duration: float | None = None
+        self.segments: Dict[str, float] = dict.fromkeys(SEGMENTS, 0.0)
+
+    def add(self, segment: str, seconds: float) -> None:
+        # Tasks spawned by the handler may outlive it, their time is not ours
+        if self.duration is None:
+            self.segments[segment] += seconds
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started
+
+    def describe(self) -> str:
+        duration = self.duration or 0.0
+        other = duration - sum(self.segments.values())
+        parts = [
+            f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.segments.items()
+        ]
+        return (
+            f"{self.handler} user={self.user_id} total={duration * 1000:.1f}ms "
+            f"{' '.join(parts)} other={other * 1000:.1f}ms"
+        )
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def segment(name: str) -> Iterator[None]:
+    """Adds the time spent in the block to the current span, if there is one."""
+    span = current_span.get()
+    if span is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.add(name, time.perf_counter() - started)
+
+
+class Tracer:
+    """Records a span per update and reports the slow ones.
+
+    Spans taking at least slow_threshold seconds are logged with their
+    breakdown. If profile_dir is set, a profile_sample_rate share of the
+    updates runs under cProfile and the profile is kept in profile_dir when
+    the update turns out to be slow. Only one update is profiled at a time,
+    and since cProfile follows the thread, other updates running on the
+    event loop meanwhile show up in the profile too.
+    """
+
+    def __init__(
+        self,
+        slow_threshold: float,
+        profile_dir: str | None = None,
+        profile_sample_rate: float = 0.0,
+    ) -> None:
+        self.slow_threshold = slow_threshold
+        self.profile_dir = profile_dir
+        self.profile_sample_rate = profile_sample_rate
+        self.stats: Counter = Counter()
+        self._profiling = False
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def _start_profiler(self) -> cProfile.Profile | None:
+        if (
+            not self.profile_dir
+            or self._profiling
+            or random.random() >= self.profile_sample_rate
+        ):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active
+            return None
+        self._profiling = True
+        return profiler
+
+    def _report(self, span: Span, profiler: cProfile.Profile | None) -> None:
+        self.stats["spans"] += 1
+        if span.duration is None or span.duration < self.slow_threshold:
+            return
+        self.stats["slow"] += 1
+        logging.warning("Slow update: %s", span.describe())
+        if profiler is not None and self.profile_dir:
+            path = os.path.join(
+                self.profile_dir,
+                f"{time.time_ns()}_{span.handler}_{span.user_id}.prof",
+            )
+            try:
+                profiler.dump_stats(path)
+                self.stats["profiled"] += 1
+                logging.warning("Profile of slow update written to %s", path)
+            except OSError as e:
+                logging.error("Error writing profile %s: %s", path, e)
+
+    async def trace(self, name: str, update: object, awaitable: Awaitable[T]) -> T:
+        """Awaits awaitable inside a new span named name.
+
+        If the current span is still running, the time is added to it instead.
+        """
+        span = current_span.get()
+        if span is not None and span.duration is None:
+            return await awaitable
+        user = getattr(update, "effective_user", None)
+        span = Span(name, user.id if user else None)
+        token = current_span.set(span)
+        profiler = self._start_profiler()
+        try:
+            return await awaitable
+        finally:
+            span.finish()
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            current_span.reset(token)
+            self._report(span, profiler)
+
+    def wrap(self, name: str, callback: F) -> F:
+        """Wraps a handler callback to run it inside a span named name."""
+
+        @functools.wraps(callback)
+        async def wrapper(update: object, *args: Any, **kwargs: Any) -> Any:
+            span = current_span.get()
+            if span is not None and span.duration is None:
+                # Opened by TracingUpdateProcessor, named after the handler
+                span.handler = name
+            return await self.trace(name, update, callback(update, *args, **kwargs))
+
+        return wrapper  # type: ignore[return-value]
+
+
+class TracingUpdateProcessor(BaseUpdateProcessor):
+    """Runs every update inside a span of the tracer.
+
+    Wraps the update processor actually in use. The span starts once the inner
+    processor lets the update run, so it covers loading the user's data from
+    persistence before the handler is called, but not the time spent waiting
+    for a worker.
+    """
+
+    __slots__ = ("tracer", "inner")
+
+    def __init__(self, tracer: Tracer, inner: BaseUpdateProcessor) -> None:
+        super().__init__(max_concurrent_updates=inner.max_concurrent_updates)
+        self.tracer = tracer
+        self.inner = inner
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        await self.inner.do_process_update(
+            update, self.tracer.trace("update", update, coroutine)
+        )
+
+    async def initialize(self) -> None:
+        await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+
+class TracingRateLimiter(BaseRateLimiter[int]):
+    """Splits the Bot API time of the current span into waiting and requesting.
+
+    Wraps the rate limiter actually in use, if any, so that the time spent in
+    the request itself is reported as bot_api and the time spent waiting for
+    the inner limiter as rate_limit.
+    """
+
+    def __init__(self, inner: BaseRateLimiter | None = None) -> None:
+        self.inner = inner
+
+    async def initialize(self) -> None:
+        if self.inner is not None:
+            await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        if self.inner is not None:
+            await self.inner.shutdown()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> Any:
+        span = current_span.get()
+        if span is None:
+            if self.inner is None:
+                return await callback(*args, **kwargs)
+            return await self.inner.process_request(
+                callback, args, kwargs, endpoint, data, rate_limit_args
+            )
+
+        started = time.perf_counter()
+        request_seconds = 0.0
+
+        async def timed_callback(*call_args: Any, **call_kwargs: Any) -> Any:
+            nonlocal request_seconds
+            request_started = time.perf_counter()
+            try:
+                return await callback(*call_args, **call_kwargs)
+            finally:
+                request_seconds += time.perf_counter() - request_started
+
+        try:
+            if self.inner is None:
+                return await timed_callback(*args, **kwargs)
+            return await self.inner.process_request(
+                timed_callback, args, kwargs, endpoint, data, rate_limit_args
+            )
+        finally:
+            span.add("bot_api", request_seconds)
+            span.add("rate_limit", time.perf_counter() - started - request_seconds)
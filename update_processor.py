@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# PTB's own semaphore is acquired before do_process_update, so it is kept out of
+# the way and the worker limit is applied after the per-user lock instead.
+UNBOUNDED_UPDATES = 2**16
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different users concurrently, one at a time per user.
+
+    Updates are keyed by the effective user (falling back to the chat), so
+    button_tap and the configuration conversation never race on the same
+    user_data. Updates waiting for their user's lock do not occupy one of the
+    workers, so a user tapping quickly cannot starve everybody else.
+    """
+
+    __slots__ = ("workers", "_worker_semaphore", "_locks")
+
+    def __init__(self, workers: int):
+        super().__init__(max_concurrent_updates=UNBOUNDED_UPDATES)
+        if workers < 1:
+            raise ValueError("workers must be a positive integer!")
+        self.workers = workers
+        self._worker_semaphore = asyncio.Semaphore(workers)
+        # Per key: the lock and the number of updates holding or waiting for it
+        self._locks: Dict[int, List[Any]] = {}
+
+    @staticmethod
+    def update_key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        key = self.update_key(update)
+        if key is None:
+            async with self._worker_semaphore:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._worker_semaphore:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass